@@ -0,0 +1,228 @@
+"""
+swia-skirmish-benchmark
+Benchmarks for the Skirmish Calculator for "Star Wars: Imperial Assault"
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from swia.engine.actions import Attack
+from swia.engine.engine import Engine, Context
+from swia.model.cardloader import CardLoader
+from swia.model.groups import Group
+
+__author__ = "Valerio Di Gregorio"
+__copyright__ = "Copyright 2018, Valerio Di Gregorio"
+__date__ = '2018-04-02'
+
+SEED = 0
+
+# canonical matchups as (name, attacker, defender, range, runs, mode)
+MATCHUPS = [
+    ("surge", [50], [22], 4, 5000, 'simulate'),
+    ("surge-batch", [50], [22], 4, 200000, 'batch'),
+    ("reroll", [25, 147], [22], 1, 1000, 'simulate'),
+    ("conversion", [22], [70], 3, 5000, 'simulate'),
+    ("complex", [70], [50], 2, 5000, 'simulate'),
+    ("exact", [70], [25, 147], 3, None, 'exact'),
+]
+
+
+def create_context(loader, attacker, defender, attack_range):
+    """
+    Create a seeded context for a matchup.
+    :param loader: Card loader for the cards collection.
+    :param attacker: IDs of attacker's deployment cards.
+    :param defender: IDs of defender's deployment cards.
+    :param attack_range: Distance between attacker and defender.
+    :return: The context.
+    """
+    return Context(Group(*[loader.get_deployment_card(i) for i in attacker]),
+                   Group(*[loader.get_deployment_card(i) for i in defender]),
+                   attack_range, [Attack], SEED)
+
+
+def benchmark_matchup(loader, attacker, defender, attack_range, runs, mode):
+    """
+    Create a benchmark of a matchup.
+    :param loader: Card loader for the cards collection.
+    :param attacker: IDs of attacker's deployment cards.
+    :param defender: IDs of defender's deployment cards.
+    :param attack_range: Distance between attacker and defender.
+    :param runs: Number of runs.
+    :param mode: How attacks are simulated ('simulate', 'batch' or 'exact').
+    :return: Function that performs the benchmark and returns the number of attacks (or outcomes).
+    """
+    def run():
+        context = create_context(loader, attacker, defender, attack_range)
+        if mode == 'exact':
+            return Engine.enumerate(context)
+        if mode == 'batch':
+            Engine.simulate_batch(context, runs)
+        else:
+            for _ in range(runs):
+                Engine.simulate(context)
+        return runs
+    return run
+
+
+def benchmark_roll_apply(loader, n=200000):
+    """
+    Create a micro-benchmark of applying and reverting a roll.
+    :param loader: Card loader for the cards collection.
+    :param n: Number of iterations.
+    :return: Function that performs the benchmark and returns the number of operations.
+    """
+    context = create_context(loader, [50], [22], 4)
+    attack = Attack(context)
+    roll = attack.create_roll('blue', 0)
+
+    def run():
+        for _ in range(n):
+            roll.apply(attack)
+            roll.revert(attack)
+        return 2 * n
+    return run
+
+
+def benchmark_get_abilities(loader, n=200000):
+    """
+    Create a micro-benchmark of filtering the abilities of a group.
+    :param loader: Card loader for the cards collection.
+    :param n: Number of iterations.
+    :return: Function that performs the benchmark and returns the number of operations.
+    """
+    group = create_context(loader, [70], [22], 2).attacker
+
+    def run():
+        for i in range(n):
+            group.get_abilities(ability_type='surge', action='attack', trigger=i % 7 + 1)
+        return n
+    return run
+
+
+def benchmark_spend_surges(loader, n=50000):
+    """
+    Create a micro-benchmark of spending surges of an attack right after its modifiers.
+    :param loader: Card loader for the cards collection.
+    :param n: Number of iterations.
+    :return: Function that performs the benchmark and returns the number of operations.
+    """
+    context = create_context(loader, [22], [25], 3)
+    context.actions = 2
+    attack, = context.get_actions()
+    while attack.current_step < 5:
+        Attack.steps[attack.current_step](attack)
+        attack.current_step += 1
+    snapshot = attack.snapshot()
+
+    def run():
+        for _ in range(n):
+            attack.restore(snapshot)
+            attack.spend_surges()
+        return n
+    return run
+
+
+def benchmark_get_statistics(loader, n=20000):
+    """
+    Create a micro-benchmark of retrieving the statistics of a KPI.
+    :param loader: Card loader for the cards collection.
+    :param n: Number of iterations.
+    :return: Function that performs the benchmark and returns the number of operations.
+    """
+    context = create_context(loader, [50], [22], 4)
+    Engine.run(context, 20000)
+
+    def run():
+        for _ in range(n):
+            context.get_statistics('avoidance')
+        return n
+    return run
+
+
+def measure(benchmark, repeat):
+    """
+    Measure a benchmark.
+    :param benchmark: Function that performs the benchmark and returns the number of operations.
+    :param repeat: Number of times the benchmark is timed (the best time is kept).
+    :return: Operations per second and peak memory allocated in bytes.
+    """
+    best = None
+    operations = 0
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        operations = benchmark()
+        elapsed_time = time.perf_counter() - start_time
+        best = elapsed_time if best is None or elapsed_time < best else best
+    tracemalloc.start()
+    benchmark()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return operations / best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", dest="output", type=str, required=False, default=None,
+                        help="file where the results are written (JSON)")
+    parser.add_argument("-b", "--baseline", dest="baseline", type=str, required=False, default=None,
+                        help="file with baseline results to compare with (JSON)")
+    parser.add_argument("-t", "--threshold", dest="threshold", type=float, required=False, default=10,
+                        help="slowdown from the baseline reported as a regression (in percentage)")
+    parser.add_argument("-r", "--repeat", dest="repeat", type=int, required=False, default=3,
+                        help="number of times each benchmark is timed")
+    parser.add_argument("-k", "--only", dest="only", nargs='+', type=str, required=False, default=None,
+                        help="names of the benchmarks to run")
+    args = parser.parse_args()
+
+    loader = CardLoader()
+    benchmarks = [(f"matchup/{name}", lambda m=(a, d, r, n, mode): benchmark_matchup(loader, *m))
+                  for name, a, d, r, n, mode in MATCHUPS]
+    benchmarks += [
+        ("micro/Roll.apply", lambda: benchmark_roll_apply(loader)),
+        ("micro/Group.get_abilities", lambda: benchmark_get_abilities(loader)),
+        ("micro/Attack.spend_surges", lambda: benchmark_spend_surges(loader)),
+        ("micro/Context.get_statistics", lambda: benchmark_get_statistics(loader)),
+    ]
+
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    regressions = []
+    for name, create_benchmark in benchmarks:
+        if args.only is not None and name not in args.only and name.split('/')[1] not in args.only:
+            continue
+        ops, peak = measure(create_benchmark(), args.repeat)
+        results[name] = {'ops_per_sec': ops, 'peak_memory': peak}
+        line = f"{name:32} {ops:14.1f} ops/s {peak / 1024:10.1f} KiB"
+        if name in baseline:
+            change = 100 * (ops / baseline[name]['ops_per_sec'] - 1)
+            line += f" {change:+7.1f}%"
+            if change < -args.threshold:
+                regressions.append(name)
+                line += " REGRESSION"
+        print(line)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, f, indent=2)
+
+    if len(regressions) > 0:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
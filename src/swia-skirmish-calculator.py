@@ -5,10 +5,14 @@ Skirmish Calculator for "Star Wars: Imperial Assault"
 
 import argparse
 import sys
-import time
+from math import sqrt
+from statistics import NormalDist
 
 from swia.engine.actions import Attack
-from swia.engine.engine import Engine, Context
+from swia.engine.cache import ResultCache
+from swia.engine.profiler import Profiler
+from swia.engine.progress import TerminalProgress
+from swia.engine.report import Report
 from swia.model.cardloader import CardLoader
 from swia.model.groups import Group
 
@@ -17,6 +21,38 @@ __copyright__ = "Copyright 2018, Valerio Di Gregorio"
 __date__ = '2018-04-02'
 
 
+def print_comparison(results, names, stats, confidence):
+    """
+    Print the results of two matchups simulated with the same dice and their paired differences.
+    :param results: The results of the comparison as returned by Report.compare.
+    :param names: Names of the baseline and candidate matchups.
+    :param stats: The statistics to print.
+    :param confidence: Confidence level of the precision.
+    """
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    baseline, candidate, difference = results['baseline'], results['candidate'], results['difference']
+    width = max(len(name) for name in names) + 12
+    for stat in stats:
+        baseline_result = baseline['stats'][stat['stat']]
+        candidate_result = candidate['stats'][stat['stat']]
+        difference_result = difference['stats'][stat['stat']]
+        idx = list(range(difference_result['min'], difference_result['min'] + len(difference_result['counts'])))
+        unpaired_precision = z * sqrt(baseline_result['standard_error'] ** 2 +
+                                      candidate_result['standard_error'] ** 2)
+        print(f"\n{'-'*width}")
+        print(f"{stat['name']} @ range {difference['range']} ({difference['runs']} paired runs)")
+        print(f"{'-'*width}")
+        print()
+        print(f"{names[0]}: {baseline_result['mean']} {stat['unit']}(s)")
+        print(f"{names[1]}: {candidate_result['mean']} {stat['unit']}(s)")
+        print()
+        print("Difference PDF:")
+        for i in range(0, len(idx)):
+            print(f"{idx[i]:+d}: {difference_result['pdf'][i]}%")
+        print(f"\nDifference: {difference_result['mean']:+} ± {z * difference_result['standard_error']:.4f} "
+              f"{stat['unit']}(s) ({int(confidence*100)}% confidence, ±{unpaired_precision:.4f} without pairing)")
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-a", "--attacker",
@@ -25,34 +61,68 @@ def main():
     parser.add_argument("-d", "--defender",
                         nargs='+', dest="defender", type=int, required=True,
                         help="IDs of defender's deployment cards (in order: card, upgrade)")
-    parser.add_argument("-r", "--range", dest="range", type=int, required=True,
-                        help="distance between attacker and defender")
+    parser.add_argument("-r", "--range", dest="range", nargs='+', type=int, required=True,
+                        help="distances between attacker and defender (simulated with the same dice)")
     parser.add_argument("-n", "--runs", dest="runs", type=int, required=False, default=20000,
-                        help="number of runs")
+                        help="number of runs (maximum number of runs with a target precision)")
     parser.add_argument("-s", "--seed", dest="seed", type=int, required=False, default=None,
                         help="seed for the RNG")
+    parser.add_argument("-w", "--workers", dest="workers", type=int, required=False, default=1,
+                        help="number of worker processes")
+    parser.add_argument("-e", "--exact", dest="exact", action="store_true",
+                        help="enumerate every outcome for exact statistics (runs and seed are ignored)")
+    parser.add_argument("-p", "--precision", dest="precision", type=float, required=False, default=None,
+                        help="stop when averages are within this precision")
+    parser.add_argument("--cdf-precision", dest="cdf_precision", type=float, required=False, default=None,
+                        help="stop when CDFs are also within this precision (in percentage)")
+    parser.add_argument("--confidence", dest="confidence", type=float, required=False, default=0.95,
+                        help="confidence level of the precision")
+    parser.add_argument("-c", "--cache", dest="cache", type=str, nargs='?', required=False, default=None,
+                        const=ResultCache.DEFAULT_PATH,
+                        help="reuse results cached in a SQLite database (exact or seeded runs only)")
+    parser.add_argument("--profile", dest="profile", type=str, nargs='?', required=False, default=None,
+                        const='',
+                        help="time steps, abilities and lookahead of the attacks in a single process "
+                             "(and export them as JSON)")
+    parser.add_argument("--compare-attacker", nargs='+', dest="compare_attacker", type=int, required=False,
+                        default=None,
+                        help="IDs of attacker's deployment cards to compare with, simulated with the same dice")
+    parser.add_argument("--compare-defender", nargs='+', dest="compare_defender", type=int, required=False,
+                        default=None,
+                        help="IDs of defender's deployment cards to compare with, simulated with the same dice")
+    parser.add_argument("-f", "--format", dest="format", type=str, required=False, default='text',
+                        choices=['text'] + Report.FORMATS, help="format of the results")
+    parser.add_argument("-o", "--output", dest="output", type=str, required=False, default=None,
+                        help="file where the results are written (standard output by default)")
     args = parser.parse_args()
+    if len(args.range) > 1 and args.precision is not None:
+        parser.error("a target precision requires a single range")
+    attack_range = args.range[0] if len(args.range) == 1 else sorted(set(args.range))
+    comparison = args.compare_attacker is not None or args.compare_defender is not None
+    if comparison:
+        if args.exact or args.precision is not None or len(args.range) > 1:
+            parser.error("a comparison requires a single range, without exact statistics nor target precision")
+        if args.format not in ['text', 'json']:
+            parser.error("a comparison can be written as text or json only")
+        args.compare_attacker = args.compare_attacker or args.attacker
+        args.compare_defender = args.compare_defender or args.defender
 
     loader = CardLoader()
     attacker = Group(*[loader.get_deployment_card(i) for i in args.attacker])
     defender = Group(*[loader.get_deployment_card(i) for i in args.defender])
+    text = args.format == 'text'
+    n = len(attacker.full_name) + len(defender.full_name) + 3
 
-    print(f"+{'-'*(len(attacker.full_name)+2)}+    +{'-'*(len(defender.full_name)+2)}+")
-    print(f"| {attacker.full_name} | VS | {defender.full_name} |")
-    print(f"+{'-'*(len(attacker.full_name)+2)}+    +{'-'*(len(defender.full_name)+2)}+\n")
+    matchups = [(attacker, defender)]
+    if comparison:
+        matchups.append((Group(*[loader.get_deployment_card(i) for i in args.compare_attacker]),
+                         Group(*[loader.get_deployment_card(i) for i in args.compare_defender])))
 
-    context = Context(attacker, defender, args.range, [Attack], args.seed)
-    n = len(attacker.full_name) + len(defender.full_name) + 3
-    start_time = time.time()
-    for i in range(args.runs):
-        Engine.simulate(context)
-        p = ((i + 1) * 100 // args.runs)
-        c = ((i + 1) * n // args.runs)
-        sys.stdout.write(f"\r[{'X'*c}{' '*(n-c)}] [{'' if p == 100 else ' '}{p}%]")
-        sys.stdout.flush()
-    print()
-    elapsed_time = time.time() - start_time
-    print(f"\nElapsed time: {int(elapsed_time*100)/100}s")
+    if text:
+        for matchup_attacker, matchup_defender in matchups:
+            print(f"+{'-'*(len(matchup_attacker.full_name)+2)}+    +{'-'*(len(matchup_defender.full_name)+2)}+")
+            print(f"| {matchup_attacker.full_name} | VS | {matchup_defender.full_name} |")
+            print(f"+{'-'*(len(matchup_attacker.full_name)+2)}+    +{'-'*(len(matchup_defender.full_name)+2)}+\n")
 
     stats = [
         {"name": "Total damage", "stat": "total_damage", "unit": "damage"},
@@ -61,20 +131,104 @@ def main():
         {"name": "Reroll impact", "stat": "reroll_impact", "unit": "damage"},
     ]
 
-    for stat in stats:
-        idx, pdf, cdf, avg = context.get_statistics(stat['stat'])
+    cache = None
+    key = None
+    results = None
+    profiler = None
+    if args.profile is not None:
+        profiler = Profiler()
+        args.workers = 1
+        args.cache = None
+    if args.cache is not None and not comparison and (args.exact or args.seed is not None):
+        cache = ResultCache(args.cache)
+        # precision of the results is computed at the confidence level, even with a fixed number of runs
+        runs = [args.runs, args.precision, args.cdf_precision, args.confidence]
+        key = ResultCache.get_key(loader, args.attacker, args.defender, attack_range, [Attack],
+                                  None if args.exact else runs, None if args.exact else args.seed)
+        results = cache.get(key)
+
+    if profiler is not None:
+        profiler.enable()
+    if results is None:
+        progress = None
+        if text and not args.exact:
+            progress = TerminalProgress(args.runs, TerminalProgress.bar(n))
+        if comparison:
+            results = Report.compare(loader, args.attacker, args.defender, args.compare_attacker,
+                                     args.compare_defender, attack_range, args.runs, args.seed, args.workers,
+                                     args.confidence, None if progress is None else progress.update)
+        elif isinstance(attack_range, list):
+            results = Report.simulate_ranges(loader, args.attacker, args.defender, attack_range, args.runs,
+                                             args.seed, args.exact, args.workers,
+                                             None if progress is None else progress.update)
+        else:
+            results = Report.simulate(loader, args.attacker, args.defender, attack_range, args.runs, args.seed,
+                                      args.exact, args.workers, args.precision, args.cdf_precision,
+                                      args.confidence, None if progress is None else progress.update)
+        if progress is not None:
+            progress.finish()
+        if cache is not None:
+            cache.put(key, results)
+    else:
+        # nothing has been simulated this time
+        for result in results if isinstance(results, list) else [results]:
+            result['elapsed_time'] = 0.0
+        if text:
+            print("Cached results.")
+    if cache is not None:
+        cache.close()
+    if profiler is not None:
+        profiler.disable()
+
+    if not text:
+        if args.output is None:
+            Report.write(sys.stdout, results, args.format)
+        else:
+            Report.write_file(args.output, results, args.format)
+        if profiler is not None and args.profile:
+            profiler.export(args.profile)
+        return
+
+    if comparison:
+        print(f"\nElapsed time: {int(results['difference']['elapsed_time']*100)/100}s")
+        print_comparison(results, [f"{a.full_name} VS {d.full_name}" for a, d in matchups], stats, args.confidence)
+        results = []
+    elif isinstance(results, dict):
+        results = [results]
+    if len(results) > 0:
+        print(f"\nElapsed time: {int(results[0]['elapsed_time']*100)/100}s")
+
+    for result in results:
+        description = f"exact, {result['outcomes']} outcomes" if args.exact else f"{result['runs']} runs"
+        for stat in stats:
+            stat_result = result['stats'][stat['stat']]
+            idx = list(range(stat_result['min'], stat_result['min'] + len(stat_result['counts'])))
+            pdf, cdf, avg = stat_result['pdf'], stat_result['cdf'], stat_result['mean']
+            print(f"\n{'-'*(len(attacker.full_name)+len(defender.full_name)+12)}")
+            print(f"{stat['name']} @ range {result['range']} ({description})")
+            print(f"{'-'*(len(attacker.full_name)+len(defender.full_name)+12)}")
+            print()
+            print("PDF:")
+            for i in range(0, len(pdf)):
+                print(f"{idx[i]}: {pdf[i]}%")
+            print()
+            print("CDF:")
+            for i in range(0, len(cdf)):
+                print(f"{idx[i]}: {cdf[i]}%")
+            print(f"\nAverage: {avg} {stat['unit']}(s)")
+            if args.precision is not None and not args.exact:
+                avg_precision, cdf_precision = stat_result['precision']
+                print(f"Precision: ±{avg_precision:.4f} {stat['unit']}(s), ±{cdf_precision:.2f}% CDF "
+                      f"({int(args.confidence*100)}% confidence)")
+
+    if profiler is not None:
         print(f"\n{'-'*(len(attacker.full_name)+len(defender.full_name)+12)}")
-        print(f"{stat['name']} @ range {args.range} ({args.runs} runs)")
+        print("Profile (inclusive wall time)")
         print(f"{'-'*(len(attacker.full_name)+len(defender.full_name)+12)}")
         print()
-        print("PDF:")
-        for i in range(0, len(pdf)):
-            print(f"{idx[i]}: {pdf[i]}%")
-        print()
-        print("CDF:")
-        for i in range(0, len(cdf)):
-            print(f"{idx[i]}: {cdf[i]}%")
-        print(f"\nAverage: {avg} {stat['unit']}(s)")
+        print(profiler.format())
+        if args.profile:
+            profiler.export(args.profile)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,39 @@
+"""
+swia-skirmish-service
+Simulation service for "Star Wars: Imperial Assault" skirmish
+"""
+
+import argparse
+import asyncio
+import os
+
+from swia.engine.service import Service
+
+__author__ = "Valerio Di Gregorio"
+__copyright__ = "Copyright 2018, Valerio Di Gregorio"
+__date__ = '2018-04-02'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", dest="host", type=str, required=False, default='127.0.0.1',
+                        help="host to listen on")
+    parser.add_argument("-p", "--port", dest="port", type=int, required=False, default=8080,
+                        help="port to listen on")
+    parser.add_argument("-u", "--unix-socket", dest="socket", type=str, required=False, default=None,
+                        help="path of a Unix socket to listen on instead of host and port")
+    parser.add_argument("-w", "--workers", dest="workers", type=int, required=False, default=os.cpu_count(),
+                        help="number of worker processes")
+    args = parser.parse_args()
+
+    service = Service(workers=args.workers)
+    where = args.socket if args.socket is not None else f"http://{args.host}:{args.port}"
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.socket,
+                                  lambda: print(f"Listening on {where} ({args.workers} workers)", flush=True)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
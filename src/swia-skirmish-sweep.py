@@ -0,0 +1,48 @@
+"""
+swia-skirmish-sweep
+Matchups sweep for "Star Wars: Imperial Assault" skirmish
+"""
+
+import argparse
+import os
+import time
+
+from swia.engine.progress import TerminalProgress
+from swia.engine.report import Report
+from swia.engine.sweep import Sweep
+from swia.model.cardloader import CardLoader
+
+__author__ = "Valerio Di Gregorio"
+__copyright__ = "Copyright 2018, Valerio Di Gregorio"
+__date__ = '2018-04-02'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", dest="output", type=str, required=True,
+                        help="file where the results are written")
+    parser.add_argument("-f", "--format", dest="format", type=str, required=False, default='columnar',
+                        choices=Report.FORMATS, help="format of the results")
+    parser.add_argument("-r", "--range", dest="range", type=int, required=False, default=8,
+                        help="maximum distance between attacker and defender")
+    parser.add_argument("-n", "--runs", dest="runs", type=int, required=False, default=20000,
+                        help="number of runs for each matchup")
+    parser.add_argument("-s", "--seed", dest="seed", type=int, required=False, default=None,
+                        help="seed for the RNG")
+    parser.add_argument("-w", "--workers", dest="workers", type=int, required=False, default=os.cpu_count(),
+                        help="number of worker processes")
+    args = parser.parse_args()
+
+    sweep = Sweep(CardLoader(), args.range, args.runs, args.seed)
+
+    progress = TerminalProgress(len(sweep.matchups), lambda completed, total: f"[{completed}/{total}] matchups")
+
+    start_time = time.time()
+    sweep.run(args.output, args.workers, progress.update, args.format)
+    progress.finish()
+    elapsed_time = time.time() - start_time
+    print(f"\nElapsed time: {int(elapsed_time*100)/100}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,6 @@ actions
 Actions module for "Star Wars: Imperial Assault"
 """
 
-import _pickle as pickle
-
 from swia.model.dice import Die
 
 __author__ = "Valerio Di Gregorio"
@@ -14,9 +12,20 @@ __date__ = '2018-04-02'
 
 class Roll:
 
-    def __init__(self, color):
+    __slots__ = ('_die', '_face', '_times')
+
+    def __init__(self, color, rng=None, face=None):
+        self.reset(color, rng, face)
+
+    def reset(self, color, rng=None, face=None):
+        """
+        Roll a die from scratch, so that the same roll can be reused.
+        :param color: Color of the die.
+        :param rng: Source of the faces. Global RNG if None.
+        :param face: Face of the die. Rolled if None.
+        """
         self._die = Die.create(color)
-        self._face = self._die.roll()
+        self._face = self._die.roll(rng) if face is None else face
         self._times = 0
 
     @property
@@ -31,26 +40,52 @@ class Roll:
     def rerolled(self):
         return self._times > 0
 
-    def reroll(self, face=None, simulated=False):
+    def reroll(self, face=None, simulated=False, rng=None):
         if self.rerolled:
             raise RuntimeError("Can't reroll a die twice.")
         if face is None:
-            face = self._die.roll()
+            face = self._die.roll(rng)
         self._face = face
         if not simulated:
             self._times += 1
 
+    def snapshot(self):
+        """
+        Capture the mutable state of the roll.
+        :return: The state of the roll.
+        """
+        return self._face, self._times
+
+    def restore(self, snapshot):
+        """
+        Restore a state of the roll.
+        :param snapshot: The state of the roll returned by snapshot.
+        """
+        self._face, self._times = snapshot
+
     def apply(self, action):
-        for attribute, value in self._die.get_face(self._face).items():
-            setattr(action, attribute, getattr(action, attribute, 0) + value)
+        damage, accuracy, surge, block, evade, dodge = self._die.table[self._face]
+        action.damage += damage
+        action.accuracy += accuracy
+        action.surge += surge
+        action.block += block
+        action.evade += evade
+        action.dodge += dodge
 
     def revert(self, action):
-        for attribute, value in self._die.get_face(self._face).items():
-            setattr(action, attribute, getattr(action, attribute, 0) - value)
+        damage, accuracy, surge, block, evade, dodge = self._die.table[self._face]
+        action.damage -= damage
+        action.accuracy -= accuracy
+        action.surge -= surge
+        action.block -= block
+        action.evade -= evade
+        action.dodge -= dodge
 
 
 class Action:
 
+    __slots__ = ('context', '_name', '_cost')
+
     def __init__(self, name, context, cost=1):
         """
         Create an action.
@@ -61,6 +96,12 @@ class Action:
         self._name = name
         self._cost = cost
 
+    def reset(self):
+        """
+        Reset the action, so that it can be performed again.
+        """
+        pass
+
     def _do_perform(self):
         """
         Abstract method for performing the action.
@@ -81,12 +122,34 @@ class Action:
 
 class Attack(Action):
 
+    __slots__ = ('pierce', 'accuracy', 'damage', 'surge', 'block', 'evade', 'dodge',
+                 'rolls', 'rerolls_priority', '_surge_abilities', 'skipped_abilities', 'miss',
+                 'total_damage', 'avoidance', 'surge_left', 'no_rerolls_total_damage',
+                 'current_step', '_rolls_cache', '_rolls_used')
+
+    # maximum number of surge spending decisions remembered by each group
+    SURGE_DECISIONS = 4096
+
+    # maximum number of damages without evades and dodges remembered by each group
+    UNDEFENDED_DAMAGES = 4096
+
     def __init__(self, context):
         """
         Create an attack action.
         """
         super().__init__('Attack', context, 1)
+        self.rolls = {'attack': [], "defense": []}
+        self.rerolls_priority = {}
+        self._surge_abilities = []
+        # abilities skipped while their own lookahead is simulated
+        self.skipped_abilities = []
+        self._rolls_cache = []
+        self.reset()
 
+    def reset(self):
+        """
+        Reset the attack in place, so that it can be performed again.
+        """
         # Attributes
         self.pierce = 0
         self.accuracy = 0
@@ -97,10 +160,13 @@ class Attack(Action):
         self.dodge = 0
 
         # Operational
-        self.rolls = {'attack': [], "defense": []}
-        self.rerolls_priority = {'attack': [], "defense": []}
-        self._surge_abilities = []
+        for rolls in self.rolls.values():
+            rolls.clear()
+        self.rerolls_priority.clear()
+        self._surge_abilities.clear()
+        self.skipped_abilities.clear()
         self.miss = False
+        self._rolls_used = 0
 
         # Stats
         self.total_damage = 0
@@ -110,20 +176,61 @@ class Attack(Action):
 
         # Attack
         self.current_step = 1
-        self.steps = {
-            1: Attack.declare,
-            2: Attack.roll,
-            3: Attack.reroll,
-            4: Attack.apply_modifiers,
-            5: Attack.spend_surges,
-            6: Attack.check_accuracy,
-            7: Attack.calculate_damage,
-        }
+
+    def create_roll(self, color, face=None):
+        """
+        Roll a die for the attack, reusing the rolls of previous runs.
+        :param color: Color of the die.
+        :param face: Face of the die. Rolled with the RNG of the context if None.
+        :return: The roll.
+        """
+        if self._rolls_used == len(self._rolls_cache):
+            roll = Roll(color, self.context.rng, face)
+            self._rolls_cache.append(roll)
+        else:
+            roll = self._rolls_cache[self._rolls_used]
+            roll.reset(color, self.context.rng, face)
+        self._rolls_used += 1
+        return roll
 
     def _do_perform(self):
         self.simulate()
         self._calculate_avoidance()
 
+    def snapshot(self):
+        """
+        Capture the mutable state of the attack, so that it can be restored after a lookahead.
+        :return: The state of the attack.
+        """
+        return (
+            (self.pierce, self.accuracy, self.damage, self.surge, self.block, self.evade, self.dodge,
+             self.miss, self.total_damage, self.avoidance, self.surge_left, self.no_rerolls_total_damage,
+             self.current_step),
+            {side: [(roll, roll.snapshot()) for roll in rolls] for side, rolls in self.rolls.items()},
+            {side: list(priority) for side, priority in self.rerolls_priority.items()},
+            list(self._surge_abilities),
+            list(self.skipped_abilities),
+        )
+
+    def restore(self, snapshot):
+        """
+        Restore a state of the attack. The same snapshot can be restored many times.
+        :param snapshot: The state of the attack returned by snapshot.
+        """
+        attributes, rolls, rerolls_priority, surge_abilities, skipped_abilities = snapshot
+        (self.pierce, self.accuracy, self.damage, self.surge, self.block, self.evade, self.dodge,
+         self.miss, self.total_damage, self.avoidance, self.surge_left, self.no_rerolls_total_damage,
+         self.current_step) = attributes
+        self.rolls = {}
+        for side, states in rolls.items():
+            self.rolls[side] = []
+            for roll, state in states:
+                roll.restore(state)
+                self.rolls[side].append(roll)
+        self.rerolls_priority = {side: list(priority) for side, priority in rerolls_priority.items()}
+        self._surge_abilities = list(surge_abilities)
+        self.skipped_abilities = list(skipped_abilities)
+
     def simulate(self):
         """
         Perform the action.
@@ -136,29 +243,49 @@ class Attack(Action):
             self.current_step += 1
 
     def _calculate_avoidance(self):
+        # assess blocked damage
+        blocked_damage = self.block - self.pierce if self.block > self.pierce else 0
+        avoided_damage = self.damage if blocked_damage > self.damage else blocked_damage
+
+        # the damage without evades and dodges depends only on this state, reuse it if it's known
+        surge_left = self.surge if self.surge > 0 else 0
+        for a in self._surge_abilities:
+            surge_left -= a.cost
+        key = (self.context.attack_range, surge_left, self.accuracy, self.damage, self.pierce, self.block,
+               tuple(self._surge_abilities))
+        damages = self.context.attacker.undefended_damages
+        undefended_damage = damages.pop(key, None)
+        if undefended_damage is None:
+            undefended_damage = self._calculate_undefended_damage()
+        damages[key] = undefended_damage
+        if len(damages) > Attack.UNDEFENDED_DAMAGES:
+            damages.popitem(last=False)
+
+        # assess evaded/dodged damage
+        self.avoidance = avoided_damage + undefended_damage - self.total_damage
+
+    def _calculate_undefended_damage(self):
+        """
+        Calculate the damage of the attack as if no evades and dodges were applied, leaving the stats unchanged.
+        :return: The damage without evades and dodges.
+        """
         # save stats
         total_damage = self.total_damage
         surge_left = self.surge_left
         no_rerolls_total_damage = self.no_rerolls_total_damage
 
-        # assess blocked damage
-        blocked_damage = self.block - self.pierce if self.block > self.pierce else 0
-        avoided_damage = self.damage if blocked_damage > self.damage else blocked_damage
-
         # repeat steps 5-7 as if no evade and dodges were applied
         self.current_step = 5
         self.evade = 0
         self.dodge = 0
         self.simulate()
-
-        # assess evaded/dodged damage
-        avoided_damage += self.total_damage - total_damage
+        undefended_damage = self.total_damage
 
         # revert stats
         self.total_damage = total_damage
-        self.avoidance = avoided_damage
         self.surge_left = surge_left
         self.no_rerolls_total_damage = no_rerolls_total_damage
+        return undefended_damage
 
     def declare(self):
         """
@@ -179,8 +306,9 @@ class Attack(Action):
         for pool_type, pool in [('attack', self.context.attacker.attack_pool),
                                 ('defense', self.context.defender.defense_pool)]:
             if pool is not None:
-                for die in pool:
-                    roll = Roll(die)
+                faces = Die.roll_pool([Die.create(color) for color in pool], self.context.rng)
+                for color, face in zip(pool, faces):
+                    roll = self.create_roll(color, face)
                     roll.apply(self)
                     self.rolls[pool_type].append(roll)
 
@@ -192,20 +320,26 @@ class Attack(Action):
         def simulate_rerolls(side):
             total = {}
             current = 0
-            dump = pickle.dumps(self, -1)
+            rerolled = {}
+            snapshot = self.snapshot()
             for i, r in enumerate(self.rolls[side]):
-                for f in range(r.die.faces):
-                    attack = pickle.loads(dump)
-                    attack.rolls[side][i].revert(attack)
-                    attack.rolls[side][i].reroll(f)
-                    attack.rolls[side][i].apply(attack)
-                    attack.current_step += 1
-                    attack.simulate()
-                    if i not in total:
-                        total[i] = 0
-                    total[i] += attack.total_damage
-                    if f == r.face:
-                        current = attack.total_damage
+                # faces with the same results are simulated once, as are dice of the same type showing them
+                face = r.die.representatives[r.face]
+                if (r.die.name, face) in rerolled:
+                    total[i] = rerolled[(r.die.name, face)]
+                    continue
+                total[i] = 0
+                for f, m in r.die.classes:
+                    r.revert(self)
+                    r.reroll(f, simulated=True)
+                    r.apply(self)
+                    self.current_step += 1
+                    self.simulate()
+                    total[i] += m * self.total_damage
+                    if f == face:
+                        current = self.total_damage
+                    self.restore(snapshot)
+                rerolled[(r.die.name, face)] = total[i]
             p = sorted(total.items(), key=lambda t: (t[1], t[0]), reverse=True)
             return p, current
 
@@ -219,11 +353,23 @@ class Attack(Action):
             n_rerolls['attack'] += a.attack
             n_rerolls['defense'] += a.defense
 
-        self.rerolls_priority = {}
-        for reroll_type in ['attack', 'defense']:
-            if n_rerolls[reroll_type] > 0:
-                self.rerolls_priority[reroll_type], self.no_rerolls_total_damage = \
-                    simulate_rerolls(reroll_type)
+        self.rerolls_priority.clear()
+        reroll_types = [reroll_type for reroll_type in ['attack', 'defense'] if n_rerolls[reroll_type] > 0]
+        if reroll_types:
+            # the best rerolls depend only on the dice and attributes rolled in this matchup, look them up if known
+            key = (self.pierce, self.accuracy, self.damage, self.surge, self.block, self.evade, self.dodge,
+                   tuple(tuple((r.die.name, r.die.representatives[r.face]) for r in self.rolls[side])
+                         for side in ['attack', 'defense']))
+            policies = self.context.reroll_policies
+            policy = policies.get(key, None)
+            if policy is None:
+                for reroll_type in reroll_types:
+                    self.rerolls_priority[reroll_type], self.no_rerolls_total_damage = \
+                        simulate_rerolls(reroll_type)
+                policies[key] = dict(self.rerolls_priority), self.no_rerolls_total_damage
+            else:
+                priorities, self.no_rerolls_total_damage = policy
+                self.rerolls_priority.update(priorities)
 
         for ability in self.context.attacker.get_abilities(action='attack', trigger=self.current_step) + \
                        self.context.defender.get_abilities(action='defense', trigger=self.current_step):
@@ -251,16 +397,29 @@ class Attack(Action):
 
         # retrieve list of applicable abilities not yet applied
         # TODO handle anything different than attacker's surge abilities that applies at this step
-        abilities = self.context.attacker.get_abilities(ability_type='surge',
-                                                        action='attack',
-                                                        trigger=self.current_step)
+        abilities = list(self.context.attacker.get_abilities(ability_type='surge',
+                                                             action='attack',
+                                                             trigger=self.current_step))
         for a in self._surge_abilities:
             if a in abilities:
                 abilities.remove(a)
 
+        # the abilities spent depend only on this state, replay them if they're known
+        gap = self._get_accuracy_gap(self.context.attacker.attack_type, self.context.attack_range)
+        key = (self.surge_left, gap, self.block, self.pierce, self.dodge, tuple(abilities))
+        decisions = self.context.attacker.surge_decisions
+        spent = decisions.pop(key, None)
+        if spent is not None:
+            decisions[key] = spent
+            for ability in spent:
+                ability.apply(self)
+                self.surge_left -= ability.cost
+                self._surge_abilities.append(ability)
+            return
+        n = len(self._surge_abilities)
+
         # check if it's possible to fulfill the accuracy gap
         # TODO: Prioritize recovery effects
-        gap = self._get_accuracy_gap(self.context.attacker.attack_type, self.context.attack_range)
         accuracy_abilities = []
         if gap > 0:
             surge_left = self.surge_left
@@ -296,6 +455,10 @@ class Attack(Action):
             abilities.remove(ability)
             ability = self.get_best_ability(abilities, priority)
 
+        decisions[key] = tuple(self._surge_abilities[n:])
+        if len(decisions) > Attack.SURGE_DECISIONS:
+            decisions.popitem(last=False)
+
     def check_accuracy(self):
         """
         Check accuracy (step 6).
@@ -367,3 +530,14 @@ class Attack(Action):
             'ranged': self.accuracy
         }[attack_type]
         return gap if gap > 0 else 0
+
+    # Attack steps
+    steps = {
+        1: declare,
+        2: roll,
+        3: reroll,
+        4: apply_modifiers,
+        5: spend_surges,
+        6: check_accuracy,
+        7: calculate_damage,
+    }
@@ -0,0 +1,107 @@
+"""
+cache
+Results cache module for "Star Wars: Imperial Assault"
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+__author__ = "Valerio Di Gregorio"
+__copyright__ = "Copyright 2018, Valerio Di Gregorio"
+__date__ = '2018-04-02'
+
+
+def _get_engine_version():
+    """
+    Retrieve the version of the engine as a hash of the sources of the swia package.
+    :return: The version of the engine.
+    """
+    version = hashlib.sha256()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for directory, _, files in sorted(os.walk(root)):
+        for name in sorted(files):
+            if name.endswith('.py'):
+                with open(os.path.join(directory, name), 'rb') as f:
+                    version.update(f.read())
+    return version.hexdigest()
+
+
+class ResultCache:
+
+    DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'swia-skirmish-calculator', 'results.sqlite')
+    ENGINE_VERSION = _get_engine_version()
+
+    def __init__(self, path=None, max_size=64 * 1024 * 1024):
+        """
+        Create a persistent cache of results, evicting the least recently used ones.
+        :param path: Path of the SQLite database. Default path if None.
+        :param max_size: Maximum size of the results stored in bytes.
+        """
+        self.path = ResultCache.DEFAULT_PATH if path is None else path
+        self.max_size = max_size
+        directory = os.path.dirname(self.path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS results "
+                             "(key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                             "size INTEGER NOT NULL, accessed REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+
+    @staticmethod
+    def get_key(loader, attacker, defender, attack_range, sequence, runs, seed):
+        """
+        Retrieve the key of the results of a simulation.
+        :param loader: Card loader used for the simulation.
+        :param attacker: IDs of attacker's deployment cards.
+        :param defender: IDs of defender's deployment cards.
+        :param attack_range: Distance between attacker and defender.
+        :param sequence: Types of the actions simulated.
+        :param runs: Number of runs. None for exact statistics.
+        :param seed: Seed for the RNG. None for exact statistics.
+        :return: The key of the results.
+        """
+        return hashlib.sha256(json.dumps([
+            list(attacker), list(defender), attack_range, [t.__name__ for t in sequence], runs, seed,
+            loader.version, ResultCache.ENGINE_VERSION,
+        ]).encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Retrieve results from the cache.
+        :param key: The key of the results.
+        :return: The results. None if they aren't cached.
+        """
+        with self._db:
+            row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """
+        Store results in the cache, evicting the least recently used results if the cache is full.
+        :param key: The key of the results.
+        :param value: The results (JSON serializable).
+        """
+        value = json.dumps(value, separators=(',', ':'))
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                             (key, value, len(value), time.time()))
+            size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            for old_key, old_size in self._db.execute("SELECT key, size FROM results ORDER BY accessed").fetchall():
+                if size <= self.max_size:
+                    break
+                self._db.execute("DELETE FROM results WHERE key = ?", (old_key,))
+                size -= old_size
+
+    def close(self):
+        """
+        Close the cache.
+        """
+        self._db.close()
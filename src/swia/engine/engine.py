@@ -3,10 +3,19 @@ skirmish_engine
 Engine module for "Star Wars: Imperial Assault"
 """
 
+import itertools
+import math
+import multiprocessing
 import random
 import sys
+from collections import Counter
+from fractions import Fraction
+from math import inf, sqrt
+from statistics import NormalDist
 
 from swia.engine.actions import Attack
+from swia.engine.histogram import Histogram
+from swia.model.dice import Die
 
 __author__ = "Valerio Di Gregorio"
 __copyright__ = "Copyright 2018, Valerio Di Gregorio"
@@ -19,7 +28,8 @@ class Context:
         Create a simulator engine.
         :param seed: Seed for the RNG.
         """
-        random.seed(random.randrange(sys.maxsize) if seed is None else seed)
+        self.seed = random.randrange(sys.maxsize) if seed is None else seed
+        self.rng = RandomDice(self.seed)
         self.sequence = [] if sequence is None else sequence
         self.actions = 0
         self.damage = 0
@@ -27,30 +37,150 @@ class Context:
         self.attacker = attacker
         self.defender = defender
         self.attack_range = attack_range
+        # actions reused across runs
+        self._actions = None
+        # contexts of the same scenario at other ranges, keyed by range
+        self._ranges = {}
+        # results of the attacks resolved by the batch engine, keyed by faces and by attributes rolled
+        self.resolved_faces = {}
+        self.resolved_attributes = {}
+        # best rerolls of the matchup, keyed by dice and attributes rolled
+        self.reroll_policies = {}
         self.stats = {
-            "total_damage": {},
-            "over_surging": {},
-            "avoidance": {},
-            "reroll_impact": {}
+            "total_damage": Histogram(),
+            "over_surging": Histogram(),
+            "avoidance": Histogram(),
+            "reroll_impact": Histogram()
         }
 
-    def collect_attack_results(self, attack: Attack):
+    def __getstate__(self):
+        # actions, attacks resolved by the batch engine and reroll policies are cached for this process only
+        state = dict(self.__dict__)
+        state['_actions'] = None
+        state['_ranges'] = {}
+        state['resolved_faces'] = {}
+        state['resolved_attributes'] = {}
+        state['reroll_policies'] = {}
+        return state
+
+    def fork(self, seed=None):
+        """
+        Create an empty context for the same scenario.
+        :param seed: Seed for the RNG of the new context.
+        :return: The new context.
+        """
+        context = Context(self.attacker, self.defender, self.attack_range, self.sequence, seed)
+        context.resolved_faces = self.resolved_faces
+        context.resolved_attributes = self.resolved_attributes
+        context.reroll_policies = self.reroll_policies
+        return context
+
+    def at_range(self, attack_range):
+        """
+        Retrieve the context of the same scenario at another range, where results at that range are collected.
+        :param attack_range: Distance between attacker and defender.
+        :return: The context at that range (this context for its own range).
+        """
+        if attack_range == self.attack_range:
+            return self
+        context = self._ranges.get(attack_range, None)
+        if context is None:
+            context = Context(self.attacker, self.defender, attack_range, self.sequence, self.seed)
+            self._ranges[attack_range] = context
+        return context
+
+    def get_collected(self):
+        """
+        Retrieve the results collected by this context alone, without the scenario and its caches
+        (i.e. to send them back from a worker process).
+        :return: The results as a tuple (stats, runs).
+        """
+        return self.stats, self.runs
+
+    def merge(self, other):
+        """
+        Merge the results collected by another context into this one.
+        :param other: The context with the results to merge.
+        """
+        self.merge_collected(other.get_collected())
+
+    def merge_collected(self, collected):
+        """
+        Merge results collected elsewhere into this context.
+        :param collected: The results to merge as returned by get_collected.
+        """
+        stats, runs = collected
+        for pki, histogram in stats.items():
+            self.stats[pki].merge(histogram)
+        self.runs += runs
+
+    def get_actions(self):
+        """
+        Retrieve the actions of the sequence, ready to be performed.
+        Actions are created once and then reset in place for each run.
+        :return: The actions of the sequence.
+        """
+        if self._actions is None:
+            self._actions = [action_type(self) for action_type in self.sequence]
+        else:
+            for action in self._actions:
+                action.reset()
+        return self._actions
+
+    @staticmethod
+    def get_attack_results(attack: Attack):
+        """
+        Retrieve the results of an attack.
+        :param attack: The attack that produced results.
+        :return: The samples of the KPIs as a tuple (total_damage, avoidance, over_surging, reroll_impact).
+        """
+        return (attack.total_damage, attack.avoidance, attack.surge_left,
+                attack.total_damage - attack.no_rerolls_total_damage)
+
+    def collect_attack_results(self, attack: Attack, weight=1):
         """
         Collect results from an attack.
         :param attack: The attack that produced results.
+        :param weight: Weight of the results (1 for a sampled run, probability for an enumerated outcome).
         """
-        self._collect_sample('total_damage', attack.total_damage)
-        self._collect_sample('avoidance', attack.avoidance)
-        self._collect_sample('over_surging', attack.surge_left)
-        self._collect_sample('reroll_impact', attack.total_damage - attack.no_rerolls_total_damage)
+        self.collect_results(Context.get_attack_results(attack), weight)
 
-    def _collect_sample(self, pki, sample):
+    def collect_results(self, results, weight=1):
+        """
+        Collect results of an attack.
+        :param results: The samples of the KPIs as returned by get_attack_results.
+        :param weight: Weight of the results (1 for a sampled run, probability for an enumerated outcome).
+        """
+        total_damage, avoidance, over_surging, reroll_impact = results
+        self._collect_sample('total_damage', total_damage, weight)
+        self._collect_sample('avoidance', avoidance, weight)
+        self._collect_sample('over_surging', over_surging, weight)
+        self._collect_sample('reroll_impact', reroll_impact, weight)
+
+    def _collect_sample(self, pki, sample, weight=1):
         """
         Helper method to collect a new sample for a KPI.
         :param pki: The PKI for the statistics.
         :param sample: The sample to collect.
+        :param weight: Weight of the sample.
+        """
+        self.stats[pki].add(sample, weight)
+
+    def get_precision(self, pki, confidence=0.95):
+        """
+        Retrieve the precision of the statistics of a given PKI, as half-widths of their confidence intervals.
+        :param pki: The PKI for the statistics.
+        :param confidence: Confidence level of the intervals.
+        :return: Precision of the average and worst precision of the CDF (in percentage) as a tuple.
         """
-        self.stats[pki][sample] = self.stats[pki].get(sample, 0) + 1
+        histogram = self.stats[pki]
+        n = histogram.count
+        if n < 2:
+            return inf, inf
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        _, _, cdf = histogram.get_distribution()
+        cdf_precision = max(z * sqrt(p * (100 - p) / n) for p in cdf)
+        return z * histogram.standard_error, cdf_precision
 
     def get_statistics(self, pki):
         """
@@ -58,26 +188,340 @@ class Context:
         :param pki: The PKI for the statistics.
         :return: Statistics for the indicator as PDF, CDF and average.
         """
-        avg = 0
-        mn = min(self.stats[pki].keys())
-        mx = max(self.stats[pki].keys())
-        pdf = [0] * (mx - mn + 1)
-        cdf = [0] * len(pdf)
-        for i in range(0, len(pdf)):
-            m = self.stats[pki].get(mn + i, 0)
-            pdf[i] = 100 * m
-            avg += (mn + i) * m
-            for j in range(0, i + 1):
-                cdf[j] += pdf[i]
-            pdf[i] /= self.runs
-        for i in range(0, len(pdf)):
-            cdf[i] /= self.runs
-        avg /= self.runs
-        return list(range(mn, mx + 1)), pdf, cdf, avg
+        idx, pdf, cdf = self.stats[pki].get_distribution()
+        return idx, pdf, cdf, self.stats[pki].mean
+
+
+class DiceEnumerator:
+
+    # choices of each kind of draw, shared by all the enumerators
+    _choices = {}
+
+    def __init__(self, by_attributes=False):
+        """
+        Create a deterministic source of die faces that walks the tree of all the possible rolls.
+        Each pass through the sequence draws the faces of the current path, taking the first choice
+        for any draw that hasn't been done before. Draws are determined only by previous draws.
+        Faces with the same results are drawn once, weighted by their number.
+        :param by_attributes: Draw pools once for all the outcomes with the same attributes in total.
+                              Only valid if nothing depends on individual dice (i.e. no rerolls).
+        """
+        self._by_attributes = by_attributes
+        self._path = []
+        self._drawn = 0
+
+    def _draw(self, key, get_choices):
+        """
+        Draw the next choice of the current path.
+        :param key: Kind of draw.
+        :param get_choices: Function that builds the choices of the draw as tuples (value, probability).
+        :return: The value of the choice on the current path.
+        """
+        choices = DiceEnumerator._choices.get(key, None)
+        if choices is None:
+            choices = DiceEnumerator._choices[key] = get_choices()
+        if self._drawn == len(self._path):
+            self._path.append([choices, 0])
+        elif self._path[self._drawn][0] is not choices:
+            raise RuntimeError("Dice drawn don't depend only on previous draws.")
+        value = choices[self._path[self._drawn][1]][0]
+        self._drawn += 1
+        return value
+
+    def roll(self, die):
+        """
+        Draw the next face of the current path.
+        :param die: The die to roll.
+        :return: The face on the current path.
+        """
+        return self._draw(('die', die.name), lambda: [(f, Fraction(m, die.faces)) for f, m in die.classes])
+
+    def roll_pool(self, dice):
+        """
+        Draw the next faces of a pool of dice on the current path.
+        :param dice: The dice in the pool.
+        :return: The faces on the current path, in the same order of the dice.
+        """
+        key = ('pool', tuple(die.name for die in dice), self._by_attributes)
+        return list(self._draw(key, lambda: DiceEnumerator._get_pool_choices(dice, self._by_attributes)))
+
+    @staticmethod
+    def _get_pool_choices(dice, by_attributes):
+        """
+        Retrieve the distinct outcomes of a pool of dice.
+        :param dice: The dice in the pool.
+        :param by_attributes: Merge outcomes with the same attributes in total.
+        :return: The outcomes of the pool as tuples (faces, probability).
+        """
+        kinds = {}
+        for position, die in enumerate(dice):
+            if by_attributes:
+                kinds.setdefault(die.name, (die, []))[1].append(position)
+            else:
+                # orderings matter when single dice are picked (e.g. ties between rerolls)
+                kinds[position] = (die, [position])
+        outcomes_by_kind = []
+        for die, positions in kinds.values():
+            k = len(positions)
+            outcomes = []
+            for combination in itertools.combinations_with_replacement(die.classes, k):
+                # number of orderings of the combination, times the number of faces of each class
+                n = math.factorial(k)
+                for c, repetitions in Counter(combination).items():
+                    n = n // math.factorial(repetitions) * c[1] ** repetitions
+                outcomes.append((positions, [f for f, _ in combination], Fraction(n, die.faces ** k)))
+            outcomes_by_kind.append(outcomes)
+
+        choices = {}
+        for outcome in itertools.product(*outcomes_by_kind):
+            faces = [0] * len(dice)
+            p = Fraction(1)
+            for positions, kind_faces, kind_p in outcome:
+                for position, face in zip(positions, kind_faces):
+                    faces[position] = face
+                p *= kind_p
+            faces = tuple(faces)
+            key = faces
+            if by_attributes:
+                key = tuple(map(sum, zip(*[die.table[f] for die, f in zip(dice, faces)])))
+            if key in choices:
+                choices[key] = (choices[key][0], choices[key][1] + p)
+            else:
+                choices[key] = (faces, p)
+        return list(choices.values())
+
+    @property
+    def weight(self):
+        """
+        Retrieve the probability of the current path.
+        :return: The probability of the current path as a fraction.
+        """
+        p = Fraction(1)
+        for choices, i in self._path[:self._drawn]:
+            p *= choices[i][1]
+        return p
+
+    def next(self):
+        """
+        Move to the next path.
+        :return: True if there's a path left to walk. Otherwise False.
+        """
+        del self._path[self._drawn:]
+        self._drawn = 0
+        while len(self._path) > 0:
+            if self._path[-1][1] + 1 < len(self._path[-1][0]):
+                self._path[-1][1] += 1
+                return True
+            self._path.pop()
+        return False
+
+
+class RandomDice:
+
+    # faces drawn at once for each number of faces
+    BLOCK_SIZE = 1024
+
+    # faces drawn at once by sources used for a single run
+    RUN_BLOCK_SIZE = 16
+
+    def __init__(self, seed=None, block_size=BLOCK_SIZE):
+        """
+        Create a random source of die faces with its own RNG, independent of any other source.
+        Faces are drawn in blocks and handed out one by one.
+        :param seed: Seed for the RNG.
+        :param block_size: Number of faces drawn at once.
+        """
+        self.random = random.Random(seed)
+        self.block_size = block_size
+        self._blocks = {}
+
+    def draw(self, faces, k):
+        """
+        Draw many faces of a die at once.
+        :param faces: Number of faces of the die.
+        :param k: Number of faces to draw.
+        :return: The faces that have been drawn.
+        """
+        return self.random.choices(range(faces), k=k)
+
+    def roll(self, die):
+        """
+        Draw a face of a die.
+        :param die: The die to roll.
+        :return: The face that has been drawn.
+        """
+        block = self._blocks.get(die.faces, None)
+        if not block:
+            block = self._blocks[die.faces] = self.draw(die.faces, self.block_size)
+        return block.pop()
+
+    def roll_pool(self, dice):
+        """
+        Draw the faces of a pool of dice.
+        :param dice: The dice in the pool.
+        :return: The faces that have been drawn, in the same order of the dice.
+        """
+        return [self.roll(die) for die in dice]
+
+
+class RecordedDice:
+
+    def __init__(self, rng):
+        """
+        Create a source of die faces that records the faces drawn from another source, so that the same faces
+        can be drawn again. Pools are recorded by their order in the run and by the position of each die,
+        while single dice (i.e. extra dice and rerolls) are recorded in order, separately for each number of faces.
+        Optional single dice can't shift the faces of the pools that way. Drawing past the end of a recording
+        draws new faces from the source.
+        :param rng: Source of the faces to record.
+        """
+        self.rng = rng
+        self._pools = []
+        self._pool = 0
+        self._faces = {}
+        self._next = {}
+
+    def clear(self):
+        """
+        Forget the recorded faces.
+        """
+        self._pools.clear()
+        self._faces.clear()
+        self.rewind()
+
+    def rewind(self):
+        """
+        Draw the recorded faces again from the first one.
+        """
+        self._pool = 0
+        self._next.clear()
+
+    def record_pool(self, dice, faces):
+        """
+        Record the faces of the next pool without drawing them from the source.
+        :param dice: The dice in the pool.
+        :param faces: The faces of the dice, in the same order.
+        """
+        self._pools.append({(position, die.faces): face for position, (die, face) in enumerate(zip(dice, faces))})
+
+    def roll(self, die):
+        """
+        Draw the next recorded face of a single die, recording a new one if there's none left.
+        :param die: The die to roll.
+        :return: The face that has been drawn.
+        """
+        faces = self._faces.setdefault(die.faces, [])
+        i = self._next.get(die.faces, 0)
+        if i == len(faces):
+            faces.append(self.rng.roll(die))
+        self._next[die.faces] = i + 1
+        return faces[i]
+
+    def roll_pool(self, dice):
+        """
+        Draw the recorded faces of the next pool, recording new ones for the dice that have none.
+        :param dice: The dice in the pool.
+        :return: The faces that have been drawn, in the same order of the dice.
+        """
+        if self._pool == len(self._pools):
+            self._pools.append({})
+        recorded = self._pools[self._pool]
+        self._pool += 1
+        faces = []
+        for position, die in enumerate(dice):
+            key = (position, die.faces)
+            face = recorded.get(key, None)
+            if face is None:
+                face = recorded[key] = self.rng.roll(die)
+            faces.append(face)
+        return faces
+
+
+class ScriptedDice:
+
+    def __init__(self, faces):
+        """
+        Create a source of die faces that draws a predetermined sequence of faces.
+        :param faces: The faces to draw in order.
+        """
+        self._faces = iter(faces)
+
+    def roll(self, die):
+        """
+        Draw the next face of the sequence.
+        :param die: The die to roll.
+        :return: The next face.
+        """
+        return next(self._faces)
+
+    def roll_pool(self, dice):
+        """
+        Draw the next faces of the sequence for a pool of dice.
+        :param dice: The dice in the pool.
+        :return: The next faces.
+        """
+        return [next(self._faces) for _ in dice]
+
+
+_worker_context = None
+
+
+def _init_worker(context):
+    """
+    Initialize a worker process of the pool.
+    :param context: Context of execution shared by all the chunks simulated by the worker.
+    """
+    global _worker_context
+    _worker_context = context
+
+
+def _simulate_chunk(chunk):
+    """
+    Simulate a chunk of attacks in a worker process of the pool.
+    :param chunk: The chunk to simulate as a tuple (seed, runs).
+    :return: The results of the chunk as returned by Context.get_collected.
+    """
+    return Engine.simulate_chunk(_worker_context, *chunk).get_collected()
+
+
+def _compare_chunk(chunk):
+    """
+    Simulate a chunk of paired attacks of two scenarios in a worker process of the pool.
+    :param chunk: The chunk to simulate as a tuple (seed, runs).
+    :return: The results of the chunk for each scenario and their paired differences,
+             as returned by Context.get_collected.
+    """
+    return tuple(result.get_collected() for result in Engine.compare_chunk(*_worker_context, *chunk))
+
+
+def _simulate_ranges_chunk(chunk):
+    """
+    Simulate a chunk of attacks at many ranges in a worker process of the pool.
+    :param chunk: The chunk to simulate as a tuple (ranges, seed, runs).
+    :return: The results of the chunk as returned by Context.get_collected, keyed by range.
+    """
+    return {attack_range: result.get_collected()
+            for attack_range, result in Engine.simulate_ranges_chunk(_worker_context, *chunk).items()}
 
 
 class Engine:
 
+    # runs simulated with the same seed
+    CHUNK_SIZE = 250
+
+    @staticmethod
+    def _perform(context):
+        """
+        Perform the sequence of actions.
+        :param context: Context of execution.
+        :return: The actions performed.
+        """
+        context.actions = 2
+        actions = context.get_actions()
+        for action in actions:
+            action.perform()
+        return actions
+
     @staticmethod
     def simulate(context):
         """
@@ -85,9 +529,371 @@ class Engine:
         :param context: Context of execution.
         :return: Results of the attack.
         """
-        context.actions = 2
-        for action_type in context.sequence:
-            action = action_type(context)
-            action.perform()
+        for action in Engine._perform(context):
             context.collect_attack_results(action)
         context.runs += 1
+
+    @staticmethod
+    def supports_batch(context):
+        """
+        Check if attacks can be simulated in batch.
+        That requires abilities to depend only on the attributes rolled (i.e. no lookahead nor extra rolls).
+        :param context: Context of execution.
+        :return: True if attacks can be simulated in batch. Otherwise False.
+        """
+        if context.sequence != [Attack]:
+            return False
+        return all(a.type == 'surge' for a in context.attacker.get_abilities(action='attack') +
+                   context.defender.get_abilities(action='defense'))
+
+    @staticmethod
+    def simulate_batch(context, runs, columns=None):
+        """
+        Simulate many attacks at once.
+        Faces of all the dice are drawn for all the runs first. Then each distinct roll is resolved
+        once, the first time its attributes show up, and collected with the number of times it was drawn.
+        :param context: Context of execution.
+        :param runs: Number of runs.
+        :param columns: Faces of each die of the attack and defense pools (in this order) for each run.
+                        Drawn with the RNG of the context if None.
+        """
+        if not Engine.supports_batch(context):
+            raise ValueError("Attacks can't be simulated in batch.")
+        dice = [Die.create(d) for d in (context.attacker.attack_pool or []) + (context.defender.defense_pool or [])]
+        if columns is None:
+            columns = [context.rng.draw(die.faces, runs) for die in dice]
+        for faces, n in Counter(zip(*columns)).items():
+            results = context.resolved_faces.get(faces, None)
+            if results is None:
+                attributes = tuple(map(sum, zip(*[die.table[f] for die, f in zip(dice, faces)])))
+                results = context.resolved_attributes.get(attributes, None)
+                if results is None:
+                    rng, context.rng = context.rng, ScriptedDice(faces)
+                    try:
+                        attack, = Engine._perform(context)
+                    finally:
+                        context.rng = rng
+                    results = context.resolved_attributes[attributes] = Context.get_attack_results(attack)
+                context.resolved_faces[faces] = results
+            context.collect_results(results, n)
+        context.runs += runs
+
+    @staticmethod
+    def simulate_chunk(context, seed, runs):
+        """
+        Simulate a chunk of attacks in a new context.
+        Attacks are simulated in batch when possible, one by one otherwise.
+        :param context: Context of execution.
+        :param seed: Seed for the RNG of the chunk.
+        :param runs: Number of runs in the chunk.
+        :return: The context with the results of the chunk.
+        """
+        result = context.fork(seed)
+        if Engine.supports_batch(result):
+            Engine.simulate_batch(result, runs)
+        else:
+            for _ in range(runs):
+                Engine.simulate(result)
+        return result
+
+    @staticmethod
+    def simulate_ranges_chunk(context, ranges, seed, runs):
+        """
+        Simulate a chunk of attacks at many ranges in new contexts, with the same dice at every range.
+        Each run draws its faces once, and every range draws them again (see RecordedDice): each die of the pools
+        gets the same face at every range. Faces drawn only at some ranges (i.e. by Fly-By or rerolls) are drawn
+        once as well and shared by the ranges drawing them, without shifting the faces of the pools.
+        Batches draw the same faces at every range, since they share the seed.
+        :param context: Context of execution.
+        :param ranges: Distances between attacker and defender.
+        :param seed: Seed for the RNG of the chunk.
+        :param runs: Number of runs in the chunk.
+        :return: The contexts with the results of the chunk, keyed by range.
+        """
+        results = {attack_range: context.at_range(attack_range).fork(seed) for attack_range in ranges}
+        if Engine.supports_batch(context):
+            for result in results.values():
+                Engine.simulate_batch(result, runs)
+            return results
+        dice = RecordedDice(RandomDice(seed))
+        for result in results.values():
+            result.rng = dice
+        for _ in range(runs):
+            dice.clear()
+            for result in results.values():
+                dice.rewind()
+                Engine.simulate(result)
+        return results
+
+    @staticmethod
+    def compare_chunk(context, other, seed, runs):
+        """
+        Simulate a chunk of paired attacks of two scenarios in new contexts, with the same dice in both scenarios.
+        Each run draws its faces once for the first scenario, and the second scenario draws them again
+        (see RecordedDice). Results of each run are paired, and the differences of their KPIs are collected as well.
+        :param context: Context of execution of the first scenario.
+        :param other: Context of execution of the second scenario.
+        :param seed: Seed for the RNG of the chunk.
+        :param runs: Number of runs in the chunk.
+        :return: The contexts with the results of the chunk for each scenario, and the context with the differences
+                 of the KPIs (second scenario minus first scenario) of each run.
+        """
+        results = context.fork(seed), other.fork(seed)
+        difference = context.fork(seed)
+        dice = RecordedDice(RandomDice(seed))
+        for result in results:
+            result.rng = dice
+        for _ in range(runs):
+            dice.clear()
+            samples = []
+            for result in results:
+                dice.rewind()
+                sample = (0, 0, 0, 0)
+                for action in Engine._perform(result):
+                    action_results = Context.get_attack_results(action)
+                    result.collect_results(action_results)
+                    sample = tuple(s + r for s, r in zip(sample, action_results))
+                result.runs += 1
+                samples.append(sample)
+            difference.collect_results(tuple(b - a for a, b in zip(*samples)))
+            difference.runs += 1
+        return results + (difference,)
+
+    @staticmethod
+    def compare(context, other, runs, workers=1, callback=None):
+        """
+        Simulate paired attacks of two scenarios (i.e. with and without an upgrade), drawing the same dice
+        in both scenarios. Results of each scenario are collected in its context.
+        Since both scenarios see the same dice, the differences of their KPIs run by run are far less noisy
+        than the difference of independent simulations.
+        :param context: Context of execution of the first scenario.
+        :param other: Context of execution of the second scenario.
+        :param runs: Number of runs.
+        :param workers: Number of processes. All the chunks are simulated in this process if 1.
+        :param callback: Function called with the number of completed runs after each chunk.
+        :return: A context with the differences of the KPIs (second scenario minus first scenario) of each run.
+        """
+        difference = context.fork(context.seed)
+        chunks = Engine._get_chunks(context, runs)
+
+        pool = None
+        if workers > 1:
+            pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=((context, other),))
+            results = pool.imap(_compare_chunk, chunks)
+        else:
+            results = (tuple(result.get_collected() for result in Engine.compare_chunk(context, other, *chunk))
+                       for chunk in chunks)
+        try:
+            completed = 0
+            for result, other_result, difference_result in results:
+                context.merge_collected(result)
+                other.merge_collected(other_result)
+                difference.merge_collected(difference_result)
+                completed += difference_result[1]
+                if callback is not None:
+                    callback(completed)
+        finally:
+            if pool is not None:
+                pool.terminate()
+        return difference
+
+    @staticmethod
+    def simulate_defenders_chunk(contexts, seed, runs):
+        """
+        Simulate a chunk of attacks of the same attacker against many defenders in new contexts,
+        with the same attack dice against every defender.
+        The faces of each die of the pools are drawn once for all the defenders, from a stream of its own.
+        In batch, they're used as they are. Otherwise, each run records the faces of the attack pool, and the rest
+        of its faces (i.e. defense dice and rerolls) are drawn once, from a stream of its own, and drawn again
+        by every defender. Either way, the dice of a defender don't depend on the other defenders.
+        :param contexts: Contexts of execution, one for each defender, with the same attacker and range.
+        :param seed: Seed for the RNG of the chunk.
+        :param runs: Number of runs in the chunk.
+        :return: The contexts with the results of the chunk, in the same order.
+        """
+        results = [context.fork(seed) for context in contexts]
+        columns = {}
+
+        def get_columns(keys):
+            for key in keys:
+                if key not in columns:
+                    columns[key] = RandomDice(f"{seed}/{key[0]}/{key[1]}/{key[2]}").draw(Die.create(key[2]).faces,
+                                                                                      runs)
+            return [columns[key] for key in keys]
+
+        attack_pool = contexts[0].attacker.attack_pool or []
+        attack_columns = get_columns([('attack', i, color) for i, color in enumerate(attack_pool)])
+        sequential = []
+        for result in results:
+            if not Engine.supports_batch(result):
+                sequential.append(result)
+                continue
+            defense_columns = get_columns([('defense', i, color)
+                                           for i, color in enumerate(result.defender.defense_pool or [])])
+            Engine.simulate_batch(result, runs, attack_columns + defense_columns)
+        if len(sequential) > 0:
+            attack_dice = [Die.create(color) for color in attack_pool]
+            rng = random.Random(seed)
+            dice = RecordedDice(None)
+            for result in sequential:
+                result.rng = dice
+            for j in range(runs):
+                dice.clear()
+                dice.record_pool(attack_dice, [column[j] for column in attack_columns])
+                dice.rng = RandomDice(rng.getrandbits(64), RandomDice.RUN_BLOCK_SIZE)
+                for result in sequential:
+                    dice.rewind()
+                    Engine.simulate(result)
+        return results
+
+    @staticmethod
+    def run_defenders(contexts, runs):
+        """
+        Simulate many attacks of the same attacker against many defenders, with the same attack dice against every
+        defender, so that the results against different defenders are directly comparable.
+        Chunks get seeds derived from the seed of the first context, and results against each defender
+        are collected in its context.
+        :param contexts: Contexts of execution, one for each defender, with the same attacker and range.
+        :param runs: Number of runs.
+        """
+        for seed, n in Engine._get_chunks(contexts[0], runs):
+            for context, result in zip(contexts, Engine.simulate_defenders_chunk(contexts, seed, n)):
+                context.merge(result)
+
+    @staticmethod
+    def _get_chunks(context, runs):
+        """
+        Split runs in chunks, each with a seed derived from the seed of the context.
+        :param context: Context of execution.
+        :param runs: Number of runs.
+        :return: The chunks as tuples (seed, runs).
+        """
+        rng = random.Random(context.seed)
+        chunks = []
+        for i in range(0, runs, Engine.CHUNK_SIZE):
+            chunks.append((rng.randrange(sys.maxsize), min(Engine.CHUNK_SIZE, runs - i)))
+        return chunks
+
+    @staticmethod
+    def run_ranges(context, ranges, runs, workers=1, callback=None):
+        """
+        Simulate many attacks at many ranges, drawing the same dice at every range.
+        Results at each range are collected in the context at that range (see Context.at_range).
+        :param context: Context of execution.
+        :param ranges: Distances between attacker and defender.
+        :param runs: Number of runs.
+        :param workers: Number of processes. All the chunks are simulated in this process if 1.
+        :param callback: Function called with the number of completed runs after each chunk.
+        """
+        ranges = sorted(set(ranges))
+        chunks = [(ranges, seed, n) for seed, n in Engine._get_chunks(context, runs)]
+
+        pool = None
+        if workers > 1:
+            pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(context,))
+            results = pool.imap(_simulate_ranges_chunk, chunks)
+        else:
+            results = ({attack_range: result.get_collected()
+                        for attack_range, result in Engine.simulate_ranges_chunk(context, *chunk).items()}
+                       for chunk in chunks)
+        try:
+            completed = 0
+            for result in results:
+                for attack_range, range_result in result.items():
+                    context.at_range(attack_range).merge_collected(range_result)
+                completed += range_result[1]
+                if callback is not None:
+                    callback(completed)
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    @staticmethod
+    def run(context, runs, workers=1, callback=None, stop=None):
+        """
+        Simulate many attacks, split in chunks across a pool of processes.
+        Each chunk gets a seed derived from the seed of the context, so that the same seed produces
+        the same results regardless of the number of workers.
+        :param context: Context of execution.
+        :param runs: Number of runs.
+        :param workers: Number of processes. All the chunks are simulated in this process if 1.
+        :param callback: Function called with the number of completed runs after each chunk.
+        :param stop: Function called with the context after each chunk. Remaining chunks are skipped if True.
+        """
+        chunks = Engine._get_chunks(context, runs)
+
+        pool = None
+        if workers > 1:
+            pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(context,))
+            results = pool.imap(_simulate_chunk, chunks)
+        else:
+            results = (Engine.simulate_chunk(context, *chunk).get_collected() for chunk in chunks)
+        try:
+            completed = 0
+            for result in results:
+                context.merge_collected(result)
+                completed += result[1]
+                if callback is not None:
+                    callback(completed)
+                if stop is not None and stop(context):
+                    break
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    @staticmethod
+    def converge(context, precision, cdf_precision=None, confidence=0.95, max_runs=1000000, min_runs=1000,
+                 workers=1, callback=None):
+        """
+        Simulate attacks until the statistics of every PKI are precise enough.
+        Precision is checked after each chunk, so the same seed stops after the same runs regardless of workers.
+        :param context: Context of execution.
+        :param precision: Target precision of the averages.
+        :param cdf_precision: Target precision of the CDFs (in percentage). Not checked if None.
+        :param confidence: Confidence level of the precision.
+        :param max_runs: Maximum number of runs.
+        :param min_runs: Minimum number of runs.
+        :param workers: Number of processes.
+        :param callback: Function called with the number of completed runs after each chunk.
+        :return: True if the target precision has been met. Otherwise False.
+        """
+        def converged(c):
+            if c.runs < min_runs:
+                return False
+            for pki in c.stats:
+                avg_precision, pki_cdf_precision = c.get_precision(pki, confidence)
+                if avg_precision > precision:
+                    return False
+                if cdf_precision is not None and pki_cdf_precision > cdf_precision:
+                    return False
+            return True
+
+        Engine.run(context, max_runs, workers, callback, converged)
+        return converged(context)
+
+    @staticmethod
+    def enumerate(context):
+        """
+        Evaluate every possible outcome of an attack, weighted by its exact probability.
+        Outcomes with the same results are evaluated once (see DiceEnumerator).
+        :param context: Context of execution.
+        :return: Number of outcomes evaluated.
+        """
+        rerolls = context.attacker.get_abilities(ability_type='reroll', action='attack') + \
+            context.defender.get_abilities(ability_type='reroll', action='defense')
+        enumerator = DiceEnumerator(by_attributes=len(rerolls) == 0)
+        rng, context.rng = context.rng, enumerator
+        outcomes = 0
+        try:
+            while True:
+                actions = Engine._perform(context)
+                weight = enumerator.weight
+                for action in actions:
+                    context.collect_attack_results(action, weight)
+                context.runs += weight
+                outcomes += 1
+                if not enumerator.next():
+                    break
+        finally:
+            context.rng = rng
+        return outcomes
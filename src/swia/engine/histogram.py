@@ -0,0 +1,113 @@
+"""
+histogram
+Histogram module for "Star Wars: Imperial Assault"
+"""
+
+from math import sqrt
+
+__author__ = "Valerio Di Gregorio"
+__copyright__ = "Copyright 2018, Valerio Di Gregorio"
+__date__ = '2018-04-02'
+
+
+class Histogram:
+
+    def __init__(self):
+        """
+        Create an empty histogram of integer samples.
+        Moments are accumulated while samples are collected, so they can be queried at any time.
+        """
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.total_squares = 0
+        self.min = None
+        self.max = None
+
+    def add(self, sample, weight=1):
+        """
+        Collect a sample.
+        :param sample: The sample to collect.
+        :param weight: Weight of the sample.
+        """
+        self.counts[sample] = self.counts.get(sample, 0) + weight
+        self.count += weight
+        self.total += sample * weight
+        self.total_squares += sample * sample * weight
+        if self.min is None or sample < self.min:
+            self.min = sample
+        if self.max is None or sample > self.max:
+            self.max = sample
+
+    def merge(self, other):
+        """
+        Merge the samples collected by another histogram into this one.
+        :param other: The histogram with the samples to merge.
+        """
+        for sample, weight in other.counts.items():
+            self.counts[sample] = self.counts.get(sample, 0) + weight
+        self.count += other.count
+        self.total += other.total
+        self.total_squares += other.total_squares
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    @property
+    def mean(self):
+        """
+        Retrieve the mean of the samples.
+        :return: The mean of the samples.
+        """
+        return float(self.total / self.count)
+
+    @property
+    def variance(self):
+        """
+        Retrieve the variance of the samples.
+        :return: The variance of the samples.
+        """
+        mean = self.total / self.count
+        variance = float(self.total_squares / self.count - mean * mean)
+        return variance if variance > 0 else 0.0
+
+    @property
+    def standard_error(self):
+        """
+        Retrieve the standard error of the mean, using the sample variance.
+        :return: The standard error of the mean.
+        """
+        if self.count < 2:
+            return float('inf')
+        return sqrt(self.variance / (self.count - 1))
+
+    def quantile(self, q):
+        """
+        Retrieve a quantile of the samples.
+        :param q: The probability of the quantile (between 0 and 1).
+        :return: The smallest sample s such that P(X <= s) >= q.
+        """
+        if not 0 <= q <= 1:
+            raise ValueError(q)
+        cumulative = 0
+        for sample in range(self.min, self.max + 1):
+            cumulative += self.counts.get(sample, 0)
+            if cumulative >= q * self.count:
+                return sample
+        return self.max
+
+    def get_distribution(self):
+        """
+        Retrieve the distribution of the samples.
+        :return: Samples from min to max, PDF and CDF (as P(X >= sample)) in percentage.
+        """
+        idx = list(range(self.min, self.max + 1))
+        pdf = [100 * self.counts.get(sample, 0) for sample in idx]
+        cdf = [0] * len(pdf)
+        cumulative = 0
+        for i in range(len(pdf) - 1, -1, -1):
+            cumulative += pdf[i]
+            cdf[i] = float(cumulative / self.count)
+            pdf[i] = float(pdf[i] / self.count)
+        return idx, pdf, cdf
@@ -0,0 +1,169 @@
+"""
+profiler
+Profiler module for "Star Wars: Imperial Assault"
+"""
+
+import json
+import time
+
+from swia.engine.actions import Attack
+from swia.model.abilities import Ability
+
+__author__ = "Valerio Di Gregorio"
+__copyright__ = "Copyright 2018, Valerio Di Gregorio"
+__date__ = '2018-04-02'
+
+
+class Profiler:
+
+    def __init__(self):
+        """
+        Create a profiler of the attack pipeline.
+        While enabled, steps of the attacks, abilities and lookahead re-simulations are timed.
+        Disabled profilers leave the pipeline untouched, so they cost nothing.
+        Times are inclusive: a step includes the abilities and the lookahead it triggers.
+        """
+        self.records = {}
+        self._depth = 0
+        self._avoidance = False
+        self._running = []
+        self._originals = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disable()
+
+    def _get_phase(self):
+        """
+        Retrieve the phase of the attack currently running.
+        :return: 'lookahead' for re-simulations, 'avoidance' for the pass without evades and dodges,
+                 'attack' otherwise.
+        """
+        if self._depth > 1:
+            return 'lookahead'
+        return 'avoidance' if self._avoidance else 'attack'
+
+    def _record(self, kind, phase, name, elapsed_time):
+        """
+        Record a call.
+        :param kind: Kind of the call ('step', 'ability' or 'lookahead').
+        :param phase: Phase of the attack (or origin of the lookahead).
+        :param name: Name of what has been called.
+        :param elapsed_time: Time spent in the call in seconds.
+        """
+        record = self.records.setdefault(kind, {}).setdefault(phase, {}).setdefault(name, [0, 0.0])
+        record[0] += 1
+        record[1] += elapsed_time
+
+    def _wrap_step(self, step):
+        def wrapper(attack):
+            phase = self._get_phase()
+            self._running.append(step.__name__)
+            start_time = time.perf_counter()
+            try:
+                return step(attack)
+            finally:
+                self._record('step', phase, step.__name__, time.perf_counter() - start_time)
+                self._running.pop()
+        return wrapper
+
+    def _wrap_apply(self, apply, name):
+        def wrapper(ability, attack):
+            phase = self._get_phase()
+            self._running.append(name)
+            start_time = time.perf_counter()
+            try:
+                return apply(ability, attack)
+            finally:
+                self._record('ability', phase, name, time.perf_counter() - start_time)
+                self._running.pop()
+        return wrapper
+
+    def _wrap_simulate(self, simulate):
+        def wrapper(attack):
+            self._depth += 1
+            origin = self._running[-1] if self._depth > 1 and len(self._running) > 0 else None
+            start_time = time.perf_counter()
+            try:
+                return simulate(attack)
+            finally:
+                if self._depth > 1:
+                    self._record('lookahead', origin, 'branch', time.perf_counter() - start_time)
+                self._depth -= 1
+        return wrapper
+
+    def _wrap_calculate_avoidance(self, calculate_avoidance):
+        def wrapper(attack):
+            self._avoidance = True
+            try:
+                return calculate_avoidance(attack)
+            finally:
+                self._avoidance = False
+        return wrapper
+
+    def enable(self):
+        """
+        Start profiling.
+        """
+        if self._originals is not None:
+            return
+        abilities = [cls for cls in Ability.__subclasses__() if 'apply' in cls.__dict__]
+        self._originals = {
+            'steps': Attack.steps,
+            'simulate': Attack.simulate,
+            '_calculate_avoidance': Attack._calculate_avoidance,
+            'abilities': {cls: cls.apply for cls in abilities},
+        }
+        Attack.steps = {i: self._wrap_step(step) for i, step in Attack.steps.items()}
+        Attack.simulate = self._wrap_simulate(Attack.simulate)
+        Attack._calculate_avoidance = self._wrap_calculate_avoidance(Attack._calculate_avoidance)
+        for cls in abilities:
+            cls.apply = self._wrap_apply(cls.apply, cls.__name__)
+
+    def disable(self):
+        """
+        Stop profiling.
+        """
+        if self._originals is None:
+            return
+        Attack.steps = self._originals['steps']
+        Attack.simulate = self._originals['simulate']
+        Attack._calculate_avoidance = self._originals['_calculate_avoidance']
+        for cls, apply in self._originals['abilities'].items():
+            cls.apply = apply
+        self._originals = None
+
+    def get_report(self):
+        """
+        Retrieve the profile.
+        :return: Calls and seconds by kind ('step', 'ability' or 'lookahead'), phase (or origin) and name.
+        """
+        return {kind: {phase: {name: {'calls': calls, 'seconds': seconds}
+                               for name, (calls, seconds) in names.items()}
+                       for phase, names in phases.items()}
+                for kind, phases in self.records.items()}
+
+    def export(self, path):
+        """
+        Export the profile as JSON.
+        :param path: Path of the output file.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.get_report(), f, indent=2)
+
+    def format(self):
+        """
+        Format the profile as a table.
+        :return: The profile as text.
+        """
+        lines = [f"{'kind':10} {'phase':12} {'name':20} {'calls':>10} {'seconds':>10} {'us/call':>10}"]
+        for kind, phases in self.get_report().items():
+            for phase, names in phases.items():
+                for name, record in sorted(names.items(), key=lambda t: -t[1]['seconds']):
+                    calls, seconds = record['calls'], record['seconds']
+                    lines.append(f"{kind:10} {str(phase):12} {name:20} {calls:10} {seconds:10.3f} "
+                                 f"{seconds / calls * 1e6:10.1f}")
+        return "\n".join(lines)
@@ -0,0 +1,113 @@
+"""
+progress
+Progress module for "Star Wars: Imperial Assault"
+"""
+
+import sys
+import time
+
+__author__ = "Valerio Di Gregorio"
+__copyright__ = "Copyright 2018, Valerio Di Gregorio"
+__date__ = '2018-04-02'
+
+
+class Progress:
+
+    def __init__(self, total, callback=None, interval=0.1):
+        """
+        Create a progress reporter that forwards updates at a bounded rate.
+        Updates are cheap: they're reported only if enough time has passed since the last report,
+        and the last update is always reported when the progress finishes.
+        :param total: Total amount of work.
+        :param callback: Function called with the completed and total amount of work on each report.
+        :param interval: Minimum time between reports in seconds.
+        """
+        self.total = total
+        self.callback = callback
+        self.interval = interval
+        self.completed = 0
+        self._reported = None
+        self._last_time = None
+
+    def update(self, completed):
+        """
+        Update the completed amount of work.
+        :param completed: Completed amount of work.
+        """
+        self.completed = completed
+        now = time.monotonic()
+        if self._last_time is None or now - self._last_time >= self.interval:
+            self._last_time = now
+            self._reported = completed
+            self.report(completed)
+
+    def finish(self):
+        """
+        Finish the progress, reporting the last update if it hasn't been reported yet.
+        """
+        if self._reported != self.completed:
+            self._reported = self.completed
+            self.report(self.completed)
+
+    def report(self, completed):
+        """
+        Report the progress.
+        :param completed: Completed amount of work.
+        """
+        if self.callback is not None:
+            self.callback(completed, self.total)
+
+
+class TerminalProgress(Progress):
+
+    def __init__(self, total, formatter, stream=None, interval=0.1):
+        """
+        Create a progress reporter that draws a line on a terminal.
+        Nothing is drawn if the stream isn't a terminal (i.e. a pipe or a file).
+        :param total: Total amount of work.
+        :param formatter: Function that formats the line from the completed and total amount of work.
+        :param stream: Stream of the terminal. Standard output if None.
+        :param interval: Minimum time between reports in seconds.
+        """
+        super().__init__(total, None, interval)
+        self.formatter = formatter
+        self.stream = sys.stdout if stream is None else stream
+        self.enabled = self.stream.isatty()
+
+    def update(self, completed):
+        """
+        Update the completed amount of work.
+        :param completed: Completed amount of work.
+        """
+        if self.enabled:
+            super().update(completed)
+
+    def finish(self):
+        """
+        Finish the progress, drawing the last update and ending the line.
+        """
+        if self.enabled:
+            super().finish()
+            self.stream.write("\n")
+            self.stream.flush()
+
+    def report(self, completed):
+        """
+        Draw the progress.
+        :param completed: Completed amount of work.
+        """
+        self.stream.write(f"\r{self.formatter(completed, self.total)}")
+        self.stream.flush()
+
+    @staticmethod
+    def bar(width):
+        """
+        Create a formatter of a progress bar.
+        :param width: Width of the bar.
+        :return: The formatter.
+        """
+        def formatter(completed, total):
+            p = (completed * 100 // total)
+            c = (completed * width // total)
+            return f"[{'X'*c}{' '*(width-c)}] [{'' if p == 100 else ' '}{p}%]"
+        return formatter
@@ -0,0 +1,213 @@
+"""
+report
+Report module for "Star Wars: Imperial Assault"
+"""
+
+import csv
+import json
+import time
+
+from swia.engine.actions import Attack
+from swia.engine.engine import Engine, Context
+from swia.model.groups import Group
+
+__author__ = "Valerio Di Gregorio"
+__copyright__ = "Copyright 2018, Valerio Di Gregorio"
+__date__ = '2018-04-02'
+
+
+class Report:
+    PKIS = ['total_damage', 'avoidance', 'over_surging', 'reroll_impact']
+    FORMATS = ['json', 'csv', 'columnar']
+
+    @staticmethod
+    def simulate(loader, attacker, defender, attack_range, runs=20000, seed=None, exact=False, workers=1,
+                 precision=None, cdf_precision=None, confidence=0.95, callback=None):
+        """
+        Simulate a matchup and retrieve its results, without printing anything.
+        :param loader: Card loader for the cards collection.
+        :param attacker: IDs of attacker's deployment cards (in order: card, upgrade).
+        :param defender: IDs of defender's deployment cards (in order: card, upgrade).
+        :param attack_range: Distance between attacker and defender.
+        :param runs: Number of runs (maximum number of runs with a target precision).
+        :param seed: Seed for the RNG.
+        :param exact: Enumerate every outcome for exact statistics (runs and seed are ignored).
+        :param workers: Number of processes.
+        :param precision: Stop when averages are within this precision.
+        :param cdf_precision: Stop when CDFs are also within this precision (in percentage).
+        :param confidence: Confidence level of the precision.
+        :param callback: Function called with the number of completed runs after each chunk.
+        :return: The results of the matchup.
+        """
+        context = Context(Group(*[loader.get_deployment_card(i) for i in attacker]),
+                          Group(*[loader.get_deployment_card(i) for i in defender]),
+                          attack_range, [Attack], seed)
+        start_time = time.time()
+        outcomes = None
+        if exact:
+            outcomes = Engine.enumerate(context)
+        elif precision is None:
+            Engine.run(context, runs, workers, callback)
+        else:
+            Engine.converge(context, precision, cdf_precision, confidence,
+                            max_runs=runs, workers=workers, callback=callback)
+        return Report.get_results(context, attacker, defender, outcomes, time.time() - start_time, confidence)
+
+    @staticmethod
+    def simulate_ranges(loader, attacker, defender, ranges, runs=20000, seed=None, exact=False, workers=1,
+                        callback=None):
+        """
+        Simulate a matchup at many ranges and retrieve its results at each range, without printing anything.
+        Simulated runs draw the same dice at every range (see Engine.run_ranges).
+        :param loader: Card loader for the cards collection.
+        :param attacker: IDs of attacker's deployment cards (in order: card, upgrade).
+        :param defender: IDs of defender's deployment cards (in order: card, upgrade).
+        :param ranges: Distances between attacker and defender.
+        :param runs: Number of runs.
+        :param seed: Seed for the RNG.
+        :param exact: Enumerate every outcome for exact statistics (runs and seed are ignored).
+        :param workers: Number of processes.
+        :param callback: Function called with the number of completed runs after each chunk.
+        :return: The results of the matchup at each range, sorted by range.
+        """
+        ranges = sorted(set(ranges))
+        context = Context(Group(*[loader.get_deployment_card(i) for i in attacker]),
+                          Group(*[loader.get_deployment_card(i) for i in defender]),
+                          ranges[0], [Attack], seed)
+        start_time = time.time()
+        outcomes = {attack_range: None for attack_range in ranges}
+        if exact:
+            for attack_range in ranges:
+                outcomes[attack_range] = Engine.enumerate(context.at_range(attack_range))
+        else:
+            Engine.run_ranges(context, ranges, runs, workers, callback)
+        elapsed_time = time.time() - start_time
+        return [Report.get_results(context.at_range(attack_range), attacker, defender, outcomes[attack_range],
+                                   elapsed_time) for attack_range in ranges]
+
+    @staticmethod
+    def compare(loader, attacker, defender, other_attacker, other_defender, attack_range, runs=20000, seed=None,
+                workers=1, confidence=0.95, callback=None):
+        """
+        Simulate two matchups with the same dice and retrieve their results and their paired differences,
+        without printing anything (see Engine.compare).
+        :param loader: Card loader for the cards collection.
+        :param attacker: IDs of attacker's deployment cards in the baseline (in order: card, upgrade).
+        :param defender: IDs of defender's deployment cards in the baseline (in order: card, upgrade).
+        :param other_attacker: IDs of attacker's deployment cards in the candidate (in order: card, upgrade).
+        :param other_defender: IDs of defender's deployment cards in the candidate (in order: card, upgrade).
+        :param attack_range: Distance between attacker and defender.
+        :param runs: Number of runs.
+        :param seed: Seed for the RNG.
+        :param workers: Number of processes.
+        :param confidence: Confidence level of the precision.
+        :param callback: Function called with the number of completed runs after each chunk.
+        :return: The results of the baseline, of the candidate and of their difference (candidate minus baseline)
+                 as a dictionary.
+        """
+        context = Context(Group(*[loader.get_deployment_card(i) for i in attacker]),
+                          Group(*[loader.get_deployment_card(i) for i in defender]),
+                          attack_range, [Attack], seed)
+        other = Context(Group(*[loader.get_deployment_card(i) for i in other_attacker]),
+                        Group(*[loader.get_deployment_card(i) for i in other_defender]),
+                        attack_range, [Attack], context.seed)
+        start_time = time.time()
+        difference = Engine.compare(context, other, runs, workers, callback)
+        elapsed_time = time.time() - start_time
+        return {
+            'baseline': Report.get_results(context, attacker, defender, None, elapsed_time, confidence),
+            'candidate': Report.get_results(other, other_attacker, other_defender, None, elapsed_time, confidence),
+            'difference': Report.get_results(difference, other_attacker, other_defender, None, elapsed_time,
+                                             confidence),
+        }
+
+    @staticmethod
+    def get_results(context, attacker, defender, outcomes=None, elapsed_time=None, confidence=0.95):
+        """
+        Retrieve the results of a simulated matchup.
+        Histograms are stored as the first sample and the counts of all the samples from there.
+        Counts are probabilities for exact results.
+        :param context: Context of the simulated matchup.
+        :param attacker: IDs of attacker's deployment cards.
+        :param defender: IDs of defender's deployment cards.
+        :param outcomes: Number of outcomes evaluated for exact results, None for simulated ones.
+        :param elapsed_time: Time spent simulating the matchup in seconds.
+        :param confidence: Confidence level of the precision.
+        :return: The results of the matchup.
+        """
+        exact = outcomes is not None
+        stats = {}
+        for pki in Report.PKIS:
+            histogram = context.stats[pki]
+            idx, pdf, cdf = histogram.get_distribution()
+            counts = [histogram.counts.get(i, 0) for i in idx]
+            stats[pki] = {
+                'min': histogram.min,
+                'counts': [float(c) for c in counts] if exact else counts,
+                'pdf': pdf,
+                'cdf': cdf,
+                'mean': histogram.mean,
+                'variance': histogram.variance,
+                'standard_error': 0.0 if exact else histogram.standard_error,
+                'precision': None if exact else list(context.get_precision(pki, confidence)),
+            }
+        return {
+            'attacker': list(attacker),
+            'defender': list(defender),
+            'range': context.attack_range,
+            'runs': None if exact else context.runs,
+            'outcomes': outcomes,
+            'seed': None if exact else context.seed,
+            'elapsed_time': elapsed_time,
+            'stats': stats,
+        }
+
+    @staticmethod
+    def write(f, results, output_format='json'):
+        """
+        Write results of one or many matchups.
+        JSON holds everything, CSV has a row for each sample of each PKI of each matchup and columnar is a compact
+        JSON object of columns with histograms and moments only.
+        :param f: File to write to.
+        :param results: The results of a matchup, or a list of them.
+        :param output_format: Output format (json, csv or columnar).
+        """
+        if output_format == 'json':
+            json.dump(results, f, separators=(',', ':'))
+            f.write('\n')
+            return
+        if isinstance(results, dict):
+            results = [results]
+        if output_format == 'csv':
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(['attacker', 'defender', 'range', 'runs', 'outcomes', 'seed', 'elapsed_time',
+                             'pki', 'mean', 'variance', 'standard_error', 'sample', 'count', 'pdf', 'cdf'])
+            for r in results:
+                matchup = [' '.join(str(i) for i in r['attacker']), ' '.join(str(i) for i in r['defender']),
+                           r['range'], r['runs'], r['outcomes'], r['seed'], r['elapsed_time']]
+                for pki in Report.PKIS:
+                    stat = r['stats'][pki]
+                    moments = [pki, stat['mean'], stat['variance'], stat['standard_error']]
+                    writer.writerows(matchup + moments + [stat['min'] + i, count, stat['pdf'][i], stat['cdf'][i]]
+                                     for i, count in enumerate(stat['counts']))
+        elif output_format == 'columnar':
+            columns = {key: [r[key] for r in results]
+                       for key in ['attacker', 'defender', 'range', 'runs', 'outcomes', 'seed', 'elapsed_time']}
+            for pki in Report.PKIS:
+                for key in ['min', 'counts', 'mean', 'variance']:
+                    columns[f"{pki}_{key}"] = [r['stats'][pki][key] for r in results]
+            json.dump(columns, f, separators=(',', ':'))
+            f.write('\n')
+        else:
+            raise ValueError(output_format)
+
+    @staticmethod
+    def write_file(output, results, output_format='json'):
+        """
+        Write results of one or many matchups to a file.
+        :param output: Path of the output file.
+        :param results: The results of a matchup, or a list of them.
+        :param output_format: Output format (json, csv or columnar).
+        """
+        with open(output, 'w', newline='') as f:
+            Report.write(f, results, output_format)
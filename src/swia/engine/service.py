@@ -0,0 +1,255 @@
+"""
+service
+Simulation service for "Star Wars: Imperial Assault"
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+
+from swia.engine.actions import Attack
+from swia.engine.engine import Engine, Context
+from swia.engine.report import Report
+from swia.model.cardloader import CardLoader
+from swia.model.groups import Group
+
+__author__ = "Valerio Di Gregorio"
+__copyright__ = "Copyright 2018, Valerio Di Gregorio"
+__date__ = '2018-04-02'
+
+_worker_loader = None
+_worker_groups = None
+
+
+def _init_worker():
+    """
+    Initialize a worker process of the pool.
+    """
+    global _worker_loader, _worker_groups
+    _worker_loader = CardLoader()
+    _worker_groups = {}
+
+
+def _warm_up():
+    """
+    Make sure a worker process of the pool is running.
+    """
+    return None
+
+
+def _simulate_request(request):
+    """
+    Simulate a request in a worker process of the pool.
+    :param request: The request to simulate as returned by Service.parse_request.
+    :return: The results of the request.
+    """
+    return Service.simulate(_worker_loader, _worker_groups, request)
+
+
+class Service:
+    MAX_RESULTS = 1024
+
+    def __init__(self, loader=None, workers=1):
+        """
+        Create a simulation service, keeping cards and groups loaded between requests.
+        Requests are simulated by a pool of worker processes, identical requests in flight are simulated once
+        and the results of reproducible requests (seeded or exact) are kept in memory.
+        :param loader: Card loader for the cards collection.
+        :param workers: Number of worker processes.
+        """
+        if workers <= 0:
+            raise ValueError(workers)
+        self.loader = CardLoader() if loader is None else loader
+        self.workers = workers
+        self.groups = {}
+        self._executor = None
+        self._pending = {}
+        self._results = OrderedDict()
+
+    @staticmethod
+    def get_group(loader, groups, ids):
+        """
+        Retrieve a group, creating it only the first time it's requested.
+        :param loader: Card loader for the cards collection.
+        :param groups: Groups already created by IDs of their deployment cards.
+        :param ids: IDs of the deployment cards of the group (in order: card, upgrade).
+        :return: The group.
+        """
+        group = groups.get(ids, None)
+        if group is None:
+            group = Group(*[loader.get_deployment_card(i) for i in ids])
+            groups[ids] = group
+        return group
+
+    @staticmethod
+    def parse_request(loader, groups, body):
+        """
+        Parse and validate a request.
+        :param loader: Card loader for the cards collection.
+        :param groups: Groups already created by IDs of their deployment cards.
+        :param body: The request as a JSON object with attacker, defender, range and optionally runs, seed and exact.
+        :return: The request as a tuple (attacker, defender, range, runs, seed, exact).
+        """
+        try:
+            data = json.loads(body)
+            attacker = tuple(int(i) for i in data['attacker'])
+            defender = tuple(int(i) for i in data['defender'])
+            attack_range = int(data['range'])
+            runs = int(data.get('runs', 20000))
+            seed = data.get('seed', None)
+            seed = None if seed is None else int(seed)
+            exact = bool(data.get('exact', False))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid request: {e}")
+        if attack_range <= 0 or runs <= 0:
+            raise ValueError("Invalid request: range and runs must be positive.")
+        for ids in (attacker, defender):
+            try:
+                Service.get_group(loader, groups, ids)
+            except (IndexError, KeyError, RuntimeError, TypeError) as e:
+                raise ValueError(f"Invalid group {list(ids)}: {e!r}")
+        if exact:
+            runs, seed = None, None
+        return attacker, defender, attack_range, runs, seed, exact
+
+    @staticmethod
+    def simulate(loader, groups, request):
+        """
+        Simulate a request.
+        :param loader: Card loader for the cards collection.
+        :param groups: Groups already created by IDs of their deployment cards.
+        :param request: The request to simulate as returned by parse_request.
+        :return: The results of the request.
+        """
+        attacker, defender, attack_range, runs, seed, exact = request
+        context = Context(Service.get_group(loader, groups, attacker),
+                          Service.get_group(loader, groups, defender),
+                          attack_range, [Attack], seed)
+        start_time = time.time()
+        outcomes = None
+        if exact:
+            outcomes = Engine.enumerate(context)
+        else:
+            Engine.run(context, runs)
+        return Report.get_results(context, attacker, defender, outcomes, time.time() - start_time)
+
+    async def submit(self, request):
+        """
+        Simulate a request on the pool of worker processes.
+        :param request: The request to simulate as returned by parse_request.
+        :return: The results of the request.
+        """
+        results = self._results.get(request, None)
+        if results is not None:
+            self._results.move_to_end(request)
+            # nothing has been simulated this time
+            return dict(results, elapsed_time=0.0)
+        task = self._pending.get(request, None)
+        if task is None:
+            task = asyncio.ensure_future(self._run(request))
+            self._pending[request] = task
+        return await asyncio.shield(task)
+
+    async def _run(self, request):
+        """
+        Simulate a request on the pool of worker processes and keep its results if they're reproducible.
+        :param request: The request to simulate as returned by parse_request.
+        :return: The results of the request.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(self._executor, _simulate_request, request)
+        finally:
+            del self._pending[request]
+        attacker, defender, attack_range, runs, seed, exact = request
+        if exact or seed is not None:
+            self._results[request] = results
+            if len(self._results) > Service.MAX_RESULTS:
+                self._results.popitem(last=False)
+        return results
+
+    async def dispatch(self, method, path, body):
+        """
+        Dispatch a request to its endpoint.
+        :param method: HTTP method.
+        :param path: HTTP path.
+        :param body: HTTP body.
+        :return: A tuple (status, response) with the response as a JSON object.
+        """
+        path = path.split('?', 1)[0]
+        if path == '/health':
+            if method != 'GET':
+                return HTTPStatus.METHOD_NOT_ALLOWED, {'error': f"Unsupported method {method}."}
+            return HTTPStatus.OK, {'status': 'ok', 'workers': self.workers, 'pending': len(self._pending)}
+        if path == '/simulate':
+            if method != 'POST':
+                return HTTPStatus.METHOD_NOT_ALLOWED, {'error': f"Unsupported method {method}."}
+            try:
+                request = Service.parse_request(self.loader, self.groups, body)
+            except ValueError as e:
+                return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+            return HTTPStatus.OK, await self.submit(request)
+        return HTTPStatus.NOT_FOUND, {'error': f"Unknown path {path}."}
+
+    async def handle(self, reader, writer):
+        """
+        Handle a connection, serving HTTP/1.1 requests until the client closes it.
+        :param reader: Stream of the connection to read from.
+        :param writer: Stream of the connection to write to.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, path, version = line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                try:
+                    status, response = await self.dispatch(method, path, body)
+                except Exception as e:
+                    # i.e. raised by a worker process, the connection is still usable
+                    status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"Internal error: {e!r}"}
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                data = json.dumps(response).encode()
+                writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080, path=None, ready=None):
+        """
+        Serve requests until cancelled.
+        :param host: Host to listen on.
+        :param port: Port to listen on.
+        :param path: Path of the Unix socket to listen on instead of host and port.
+        :param ready: Callback invoked once the service is listening.
+        """
+        loop = asyncio.get_running_loop()
+        with concurrent.futures.ProcessPoolExecutor(self.workers, initializer=_init_worker) as executor:
+            self._executor = executor
+            await asyncio.gather(*[loop.run_in_executor(executor, _warm_up) for _ in range(self.workers)])
+            if path is None:
+                server = await asyncio.start_server(self.handle, host, port)
+            else:
+                server = await asyncio.start_unix_server(self.handle, path)
+            async with server:
+                if ready is not None:
+                    ready()
+                await server.serve_forever()
@@ -0,0 +1,191 @@
+"""
+sweep
+Sweep module for "Star Wars: Imperial Assault"
+"""
+
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from swia.engine.actions import Attack
+from swia.engine.engine import Engine, Context
+from swia.engine.report import Report
+from swia.model.cardloader import CardLoader
+from swia.model.groups import Group
+
+__author__ = "Valerio Di Gregorio"
+__copyright__ = "Copyright 2018, Valerio Di Gregorio"
+__date__ = '2018-04-02'
+
+_worker_loader = None
+
+
+def _init_worker():
+    """
+    Initialize a worker process of the pool.
+    """
+    global _worker_loader
+    _worker_loader = CardLoader()
+
+
+def _simulate_attacker(task):
+    """
+    Simulate the matchups of an attacker in a worker process of the pool.
+    :param task: The matchups to simulate as a tuple (attacker, defenders, range, runs, seed).
+    :return: The results of the matchups.
+    """
+    return Sweep.simulate_attacker(_worker_loader, *task)
+
+
+class Sweep:
+
+    def __init__(self, loader, max_range, runs, seed=None):
+        """
+        Create a sweep of all the matchups between skirmish groups.
+        :param loader: Card loader for the cards collection.
+        :param max_range: Maximum distance between attacker and defender.
+        :param runs: Number of runs for each matchup.
+        :param seed: Seed for the RNG.
+        """
+        if max_range <= 0:
+            raise ValueError(max_range)
+        self.max_range = max_range
+        self.runs = runs
+        self.seed = random.randrange(sys.maxsize) if seed is None else seed
+        groups = Sweep.get_groups(loader)
+        self.matchups = [(attacker, defender, attack_range)
+                         for attacker in groups
+                         for defender in groups
+                         for attack_range in range(1, max_range + 1)]
+
+    @staticmethod
+    def get_groups(loader):
+        """
+        Retrieve all the skirmish groups that can be simulated, with and without skirmish upgrades.
+        :param loader: Card loader for the cards collection.
+        :return: IDs of the deployment cards of each group (in order: card, upgrade).
+        """
+        cards = [c for c in loader.get_deployment_cards() if 'abilities' in c['extras']]
+        upgrades = [c for c in cards if 'Skirmish Upgrade' in c['data'].get('traits', [])]
+        groups = []
+        for card in cards:
+            if 'attack' not in card['extras'] or 'defense' not in card['extras']:
+                continue
+            for upgrade in [None] + upgrades:
+                try:
+                    Group(card, upgrade)
+                except RuntimeError:
+                    continue
+                groups.append((card['data']['id'],) if upgrade is None else
+                              (card['data']['id'], upgrade['data']['id']))
+        return groups
+
+    @staticmethod
+    def simulate_attacker(loader, attacker, defenders, attack_range, runs, seed):
+        """
+        Simulate the matchups of an attacker against many defenders at a range, with the same attack dice against
+        every defender (see Engine.run_defenders). Elapsed time is split evenly among the matchups.
+        :param loader: Card loader for the cards collection.
+        :param attacker: IDs of attacker's deployment cards.
+        :param defenders: IDs of the deployment cards of each defender.
+        :param attack_range: Distance between attacker and defender.
+        :param runs: Number of runs.
+        :param seed: Seed for the RNG.
+        :return: The results of the matchups, in the same order of the defenders.
+        """
+        group = Group(*[loader.get_deployment_card(i) for i in attacker])
+        contexts = [Context(group, Group(*[loader.get_deployment_card(i) for i in defender]),
+                            attack_range, [Attack], seed) for defender in defenders]
+        start_time = time.time()
+        Engine.run_defenders(contexts, runs)
+        elapsed_time = (time.time() - start_time) / len(defenders)
+        return [Report.get_results(context, attacker, defender, elapsed_time=elapsed_time)
+                for context, defender in zip(contexts, defenders)]
+
+    def _get_seed(self, attacker, attack_range):
+        """
+        Retrieve the seed of the matchups of an attacker at a range, derived from the seed of the sweep.
+        :param attacker: IDs of attacker's deployment cards.
+        :param attack_range: Distance between attacker and defender.
+        :return: The seed of the matchups.
+        """
+        return random.Random(f"{self.seed}/{attacker}/{attack_range}").randrange(sys.maxsize)
+
+    def _load_checkpoint(self, checkpoint):
+        """
+        Load the results of the matchups already simulated by an interrupted sweep.
+        :param checkpoint: Path of the checkpoint.
+        :return: The results of the matchups already simulated, keyed by matchup.
+        """
+        results = {}
+        if not os.path.exists(checkpoint):
+            return results
+        with open(checkpoint) as f:
+            lines = f.read().splitlines()
+        if len(lines) == 0:
+            return results
+        header = json.loads(lines[0])
+        if (header['max_range'], header['runs']) != (self.max_range, self.runs):
+            raise RuntimeError(f"{checkpoint} belongs to a sweep with different parameters!")
+        self.seed = header['seed']
+        for line in lines[1:]:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # the sweep was interrupted while writing this line
+                continue
+            results[(tuple(result['attacker']), tuple(result['defender']), result['range'])] = result
+        return results
+
+    def run(self, output, workers=1, callback=None, output_format='columnar'):
+        """
+        Simulate all the matchups and write their results in a single file.
+        Matchups of each attacker at each range are simulated together, with the same attack dice against
+        every defender. Their results are checkpointed, so that an interrupted sweep resumes where it stopped.
+        The seed of the interrupted sweep is used when resuming.
+        :param output: Path of the output file.
+        :param workers: Number of processes.
+        :param callback: Function called with the number of completed matchups after the matchups of each attacker.
+        :param output_format: Output format (json, csv or columnar).
+        """
+        checkpoint = f"{output}.partial"
+        results = self._load_checkpoint(checkpoint)
+        defenders = {}
+        for attacker, defender, attack_range in self.matchups:
+            if (attacker, defender, attack_range) not in results:
+                defenders.setdefault((attacker, attack_range), []).append(defender)
+        pending = [(attacker, defenders[(attacker, attack_range)], attack_range, self.runs,
+                    self._get_seed(attacker, attack_range))
+                   for attacker, attack_range in defenders]
+        if callback is not None:
+            callback(len(results))
+
+        with open(checkpoint, 'a') as f:
+            if len(results) == 0:
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({'max_range': self.max_range, 'runs': self.runs, 'seed': self.seed}) + '\n')
+            pool = None
+            if workers > 1:
+                pool = multiprocessing.Pool(workers, initializer=_init_worker)
+                simulated = pool.imap_unordered(_simulate_attacker, pending)
+            else:
+                loader = CardLoader()
+                simulated = (Sweep.simulate_attacker(loader, *task) for task in pending)
+            try:
+                for task_results in simulated:
+                    for result in task_results:
+                        f.write(json.dumps(result) + '\n')
+                        results[(tuple(result['attacker']), tuple(result['defender']), result['range'])] = result
+                    f.flush()
+                    if callback is not None:
+                        callback(len(results))
+            finally:
+                if pool is not None:
+                    pool.terminate()
+
+        Report.write_file(output, [results[m] for m in self.matchups], output_format)
+        os.remove(checkpoint)
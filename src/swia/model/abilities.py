@@ -3,9 +3,7 @@ abilities
 Abilities module for "Star Wars: Imperial Assault"
 """
 
-import _pickle as pickle
-
-from swia.engine.actions import Attack, Roll
+from swia.engine.actions import Attack
 
 __author__ = "Valerio Di Gregorio"
 __copyright__ = "Copyright 2018, Valerio Di Gregorio"
@@ -172,7 +170,7 @@ class RerollAbility(Ability):
                             if dmg / 6 > attack.no_rerolls_total_damage:
                                 return True
                         roll.revert(attack)
-                        roll.reroll()
+                        roll.reroll(rng=attack.context.rng)
                         roll.apply(attack)
                         n -= 1
         return False
@@ -192,7 +190,6 @@ class ConversionAbility(Ability):
         self.to_attribute = json['to']
         self.min_amount = json.get('min', None)
         self.max_amount = json.get('max', None)
-        self._skip = False
         super().__init__(json)
 
     def get_conversion_range(self, attack):
@@ -219,7 +216,7 @@ class ConversionAbility(Ability):
         :param attack: The attack where the ability is performed.
         :return: True if the ability can be applied. False otherwise.
         """
-        if self._skip:
+        if self in attack.skipped_abilities:
             return False
         n = getattr(attack, self.from_attribute['attribute'], 0)
         r = self.get_conversion_range(attack)
@@ -250,18 +247,19 @@ class ConversionAbility(Ability):
         """
 
         def simulate_conversion(rng):
+            # the lookahead state belongs to the attack, since abilities are shared by every attack of the group
             total = {}
-            self._skip = True
-            dump = pickle.dumps(attack, -1)
+            attack.skipped_abilities.append(self)
+            snapshot = attack.snapshot()
             for i in rng:
-                a = pickle.loads(dump)
-                self._do_apply(a, i)
-                a.simulate()
-                total[i] = a.total_damage
-            self._skip = False
+                self._do_apply(attack, i)
+                attack.simulate()
+                total[i] = attack.total_damage
+                attack.restore(snapshot)
+            attack.skipped_abilities.remove(self)
             return sorted(total.items(), key=lambda t: (t[1], t[0]), reverse=True)
 
-        if self._skip:
+        if self in attack.skipped_abilities:
             return False
         r = self.get_conversion_range(attack)
         if r is None:
@@ -287,7 +285,7 @@ class FlyByAbility(Ability):
         Create the Fly-By ability
         :param json: Data model that describes the ability in JSON.
         """
-        if json['type'] != 'custom':
+        if json['type'] != 'complex':
             raise ValueError(json['type'])
         if json['name'] != 'Fly-By':
             raise ValueError(json['name'])
@@ -307,7 +305,7 @@ class FlyByAbility(Ability):
         :param attack: The attack where the ability is performed.
         """
         if self.can_apply(attack):
-            roll = Roll('blue')
+            roll = attack.create_roll('blue')
             roll.apply(attack)
             attack.rolls['attack'].append(roll)
             return True
@@ -4,8 +4,10 @@ A card loader for lvisintini/imperial-assault-data collection.
 See https://github.com/lvisintini/imperial-assault-data.
 """
 
+import hashlib
 import json
 import os
+import pickle
 
 __author__ = "Valerio Di Gregorio"
 __copyright__ = "Copyright 2018, Valerio Di Gregorio"
@@ -14,14 +16,104 @@ __date__ = '2018-04-02'
 
 class CardLoader:
 
+    COLLECTIONS = ['deployment-cards', 'deployment-extras', 'command-cards', 'command-extras']
+
     def __init__(self):
         """
         Create a card loader for a cards collection.
+        Collections are loaded lazily from their binary index, or from JSON if the index is stale.
         """
         self.data = {}
-        for s in ['deployment-cards', 'deployment-extras', 'command-cards', 'command-extras']:
-            with open(f'{os.path.dirname(__file__)}/json/{s}.json') as f:
-                self.data[s] = json.load(f)
+        self._versions = {}
+
+    @staticmethod
+    def _get_paths(collection):
+        """
+        Retrieve the paths of a collection.
+        :param collection: Name of the collection.
+        :return: Paths of the JSON source and of the binary index as a tuple.
+        """
+        path = f'{os.path.dirname(__file__)}/json/{collection}'
+        return f'{path}.json', f'{path}.idx'
+
+    @staticmethod
+    def _get_signature(path):
+        """
+        Retrieve the signature of a JSON source, used to detect stale indexes.
+        :param path: Path of the JSON source.
+        :return: The signature of the JSON source.
+        """
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    @staticmethod
+    def compile(collection):
+        """
+        Compile a collection from JSON into its binary index.
+        The index holds a header (signature and version of the JSON source) followed by the cards keyed by ID.
+        :param collection: Name of the collection.
+        :return: The header and the cards of the collection as a tuple.
+        """
+        source, index = CardLoader._get_paths(collection)
+        signature = CardLoader._get_signature(source)
+        with open(source, 'rb') as f:
+            raw = f.read()
+        header = {'signature': signature, 'version': hashlib.sha256(raw).hexdigest()}
+        cards = {card['id']: card for card in json.loads(raw)}
+        try:
+            with open(f'{index}.{os.getpid()}', 'wb') as f:
+                pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(cards, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(f'{index}.{os.getpid()}', index)
+        except OSError:
+            # the index is an optimization, JSON is used if it can't be written
+            pass
+        return header, cards
+
+    @staticmethod
+    def _load(collection, header_only=False):
+        """
+        Load a collection from its binary index.
+        :param collection: Name of the collection.
+        :param header_only: Load only the header of the index.
+        :return: The header and the cards (None if header only) of the collection as a tuple.
+                 None if the index is missing or stale.
+        """
+        source, index = CardLoader._get_paths(collection)
+        try:
+            with open(index, 'rb') as f:
+                header = pickle.load(f)
+                if header['signature'] != CardLoader._get_signature(source):
+                    return None
+                return header, None if header_only else pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _get_collection(self, collection):
+        """
+        Retrieve a collection, loading it if needed.
+        :param collection: Name of the collection.
+        :return: The cards of the collection keyed by ID.
+        """
+        if collection not in self.data:
+            header, cards = CardLoader._load(collection) or CardLoader.compile(collection)
+            self.data[collection] = cards
+            self._versions[collection] = header['version']
+        return self.data[collection]
+
+    @property
+    def version(self):
+        """
+        Retrieve the version of the cards collection.
+        :return: A hash of the JSON sources of all the collections.
+        """
+        version = hashlib.sha256()
+        for collection in CardLoader.COLLECTIONS:
+            if collection not in self._versions:
+                header, _ = CardLoader._load(collection, True) or CardLoader.compile(collection)
+                self._versions[collection] = header['version']
+            version.update(self._versions[collection].encode())
+        return version.hexdigest()
 
     def _get_data_by_id(self, json_filename, card_id):
         """
@@ -30,8 +122,8 @@ class CardLoader:
         :param card_id: ID of the card.
         :return: The data with the specified ID.
         """
-        data = self.data[json_filename][card_id]
-        if data['id'] != card_id:
+        data = self._get_collection(json_filename).get(card_id, None)
+        if data is None:
             raise IndexError(card_id)
         return data
 
@@ -46,6 +138,13 @@ class CardLoader:
             'extras': self._get_data_by_id('deployment-extras', card_id)
         }
 
+    def get_deployment_cards(self):
+        """
+        Retrieve all the deployment cards from the collection.
+        :return: The deployment cards ordered by ID.
+        """
+        return [self.get_deployment_card(card_id) for card_id in sorted(self._get_collection('deployment-cards'))]
+
     def get_command_card(self, card_id):
         """
         Retrieve a command card from the collection by ID.
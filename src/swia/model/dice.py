@@ -12,21 +12,18 @@ __date__ = '2018-04-02'
 
 class Die:
 
+    # order of the attributes in the vectors of a face table
+    ATTRIBUTES = ('damage', 'accuracy', 'surge', 'block', 'evade', 'dodge')
+
     @staticmethod
     def create(die_type):
         """
-        Create a die of a specific type.
+        Retrieve a die of a specific type.
+        Dice are immutable, so the same instance is shared by every roll.
         :param die_type: Type of the die.
         :return: An instance of the die object.
         """
-        return {
-            'blue': Blue(),
-            'green': Green(),
-            'red': Red(),
-            'yellow': Yellow(),
-            'black': Black(),
-            'white': White(),
-        }.get(die_type, None)
+        return _DICE.get(die_type, None)
 
     def __init__(self, name, attributes):
         """
@@ -38,12 +35,24 @@ class Die:
             raise AttributeError('attributes')
         self.faces = None
         for key, value in attributes.items():
+            if key not in Die.ATTRIBUTES:
+                raise AttributeError(f"attributes[{key}]")
             n = len(value)
             if self.faces is not None and self.faces != n:
                 raise AttributeError(f"attributes[{key}]")
             self.faces = n
         self.name = name
-        self.attributes = attributes
+        self.attributes = {a: tuple(v) for a, v in attributes.items()}
+        self.table = tuple(
+            tuple(self.attributes[a][f] if a in self.attributes else 0 for a in Die.ATTRIBUTES)
+            for f in range(self.faces)
+        )
+        # faces with the same results, as tuples (first face, number of faces)
+        classes = {}
+        for face, vector in enumerate(self.table):
+            classes.setdefault(vector, [face, 0])[1] += 1
+        self.classes = tuple(tuple(c) for c in classes.values())
+        self.representatives = tuple(classes[vector][0] for vector in self.table)
 
     def get_face(self, face):
         """
@@ -51,14 +60,29 @@ class Die:
         :param face: A face of the die.
         :return: The result of the face.
         """
-        return {a: v[face] for a, v in self.attributes.items()}
+        return dict(zip(Die.ATTRIBUTES, self.table[face]))
 
-    def roll(self):
+    def roll(self, rng=None):
         """
         Roll the die.
+        :param rng: Source of the faces (with roll and roll_pool methods). Global RNG if None.
         :return: The face that has been rolled.
         """
-        return random.randint(0, self.faces - 1)
+        if rng is None:
+            return random.randint(0, self.faces - 1)
+        return rng.roll(self)
+
+    @staticmethod
+    def roll_pool(dice, rng=None):
+        """
+        Roll a pool of dice at once.
+        :param dice: The dice in the pool.
+        :param rng: Source of the faces (with roll and roll_pool methods). Global RNG if None.
+        :return: The faces that have been rolled, in the same order of the dice.
+        """
+        if rng is None:
+            return [die.roll() for die in dice]
+        return rng.roll_pool(dice)
 
 
 class Blue(Die):
@@ -143,3 +167,13 @@ class White(Die):
             'dodge': [0, 0, 0, 0, 0, 1]
         }
         super().__init__('White', attributes)
+
+
+_DICE = {
+    'blue': Blue(),
+    'green': Green(),
+    'red': Red(),
+    'yellow': Yellow(),
+    'black': Black(),
+    'white': White(),
+}
@@ -2,6 +2,8 @@
 groups
 Groups module for "Star Wars: Imperial Assault"
 """
+from collections import OrderedDict
+
 from swia.model.abilities import Ability
 
 __author__ = "Valerio Di Gregorio"
@@ -38,6 +40,30 @@ class Group:
                     (upgrade['extras']['abilities'] if self._skirmish_upgrade is not None else [])
         self._abilities = [Ability.create(ability) for ability in abilities]
 
+        # memos shared by every context with this group (least recently used first), the only state of the group
+        # changed by attacks: contexts in different threads can share the group, since each lookup pops its entry
+        # and puts it back and entries depend only on their keys (at worst, two threads resolve the same entry)
+
+        # surge abilities spent by attacks of this group, keyed by the state of the attack
+        self.surge_decisions = OrderedDict()
+
+        # damage of attacks of this group without evades and dodges, keyed by the state of the attack
+        self.undefended_damages = OrderedDict()
+
+        # index of the abilities by every combination of filters (None matches anything)
+        self._index = {}
+        types = {a.type for a in self._abilities}
+        triggers = {t for a in self._abilities for t in a.trigger}
+        actions = {x for a in self._abilities for x in a.action}
+        for ability_type in [None] + sorted(types):
+            for trigger in [None] + sorted(triggers):
+                for action in [None] + sorted(actions):
+                    self._index[(ability_type, trigger, action)] = tuple(
+                        a for a in self._abilities
+                        if (ability_type is None or ability_type == a.type)
+                        and (trigger is None or trigger in a.trigger)
+                        and (action is None or action in a.action))
+
     @property
     def full_name(self):
         """
@@ -75,9 +101,6 @@ class Group:
         :param ability_type: The type of the ability.
         :param trigger: The trigger used for filtering out abilities.
         :param action: The action used for filtering out abilities.
-        :return: All the abilities with the requested filters.
+        :return: All the abilities with the requested filters as a tuple.
         """
-        return [a for a in self._abilities
-                if (ability_type is None or ability_type == a.type)
-                and (trigger is None or trigger in a.trigger)
-                and (action is None or action in a.action)]
+        return self._index.get((ability_type, trigger, action), ())